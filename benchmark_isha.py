@@ -0,0 +1,264 @@
+"""Reproducible latency benchmarks for Isha Assistant.
+
+Runs the command handlers against stub termux-* executables and a local
+HTTP server standing in for the Gemini and wttr.in endpoints, so it works
+on a plain Linux box with no network. Results are printed and can be saved
+as JSON and compared with an earlier run:
+
+    python benchmark_isha.py --output new.json --compare old.json
+"""
+import argparse
+import contextlib
+import itertools
+import json
+import os
+import platform
+import socket
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+import tracemalloc
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+SCRIPT = os.path.join(HERE, "isha_assistant_termux.py")
+STUB_BINARIES = ["termux-tts-speak", "termux-open", "termux-open-url", "termux-speech-to-text"]
+
+
+class StubHandler(BaseHTTPRequestHandler):
+    """Answers Gemini and wttr.in requests after a configurable delay."""
+    protocol_version = "HTTP/1.1"
+    latency = 0.0
+
+    def setup(self):
+        super().setup()
+        # Without this, Nagle's algorithm adds ~40 ms to every keep-alive response.
+        self.connection.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+
+    def log_message(self, *args):
+        pass
+
+    def _send(self, body, content_type):
+        time.sleep(self.latency)
+        self.send_response(200)
+        self.send_header("Content-Type", content_type)
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def do_POST(self):
+        payload = json.loads(self.rfile.read(int(self.headers.get("Content-Length", 0))))
+        query = payload["contents"][0]["parts"][0]["text"]
+        answer = {"candidates": [{"content": {"parts": [{"text": f"Stub answer to {query}. It has two sentences."}]}}]}
+        if "streamGenerateContent" in self.path:
+            self._send(f"data: {json.dumps(answer)}\r\n\r\n".encode(), "text/event-stream")
+        else:
+            self._send(json.dumps(answer).encode(), "application/json")
+
+    def do_GET(self):
+        city = self.path.split("?")[0].strip("/")
+        self._send(f"{city}: +21°C".encode(), "text/plain; charset=utf-8")
+
+
+def start_stub_server(latency):
+    """Start the stand-in HTTP server on a free local port."""
+    StubHandler.latency = latency
+    server = ThreadingHTTPServer(("127.0.0.1", 0), StubHandler)
+    threading.Thread(target=server.serve_forever, name="stub-http", daemon=True).start()
+    return server
+
+
+def install_stub_binaries(directory, delay):
+    """Write termux-* stand-ins that sleep for delay seconds and succeed."""
+    for name in STUB_BINARIES:
+        path = os.path.join(directory, name)
+        with open(path, "w") as f:
+            f.write(f"#!/bin/sh\nsleep {delay}\nexit 0\n")
+        os.chmod(path, 0o755)
+
+
+def percentiles(samples):
+    """Return p50/p95/p99 and mean of samples in milliseconds."""
+    ordered = sorted(samples)
+
+    def pick(pct):
+        return ordered[min(len(ordered) - 1, int(round(pct / 100 * (len(ordered) - 1))))] * 1000
+
+    return {
+        "p50_ms": round(pick(50), 4),
+        "p95_ms": round(pick(95), 4),
+        "p99_ms": round(pick(99), 4),
+        "mean_ms": round(sum(ordered) / len(ordered) * 1000, 4),
+    }
+
+
+def measure(func, iterations, warmup=3):
+    """Time func() and sample its allocations; returns a result dict."""
+    for _ in range(warmup):
+        func()
+    samples = []
+    for _ in range(iterations):
+        start = time.perf_counter()
+        func()
+        samples.append(time.perf_counter() - start)
+    result = percentiles(samples)
+    result["iterations"] = iterations
+
+    runs = max(1, min(iterations, 20))
+    tracemalloc.start()
+    tracemalloc.reset_peak()
+    before = tracemalloc.take_snapshot()
+    for _ in range(runs):
+        func()
+    after = tracemalloc.take_snapshot()
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    allocated = sum(stat.size_diff for stat in after.compare_to(before, "filename") if stat.size_diff > 0)
+    result["alloc_bytes_per_call"] = allocated // runs
+    result["peak_alloc_bytes"] = peak
+    return result
+
+
+def measure_startup(env, runs):
+    """Time a cold module import and a cold batch run that only exits."""
+    import_samples = []
+    batch_samples = []
+    for _ in range(runs):
+        start = time.perf_counter()
+        subprocess.run([sys.executable, "-c", "import isha_assistant_termux"], cwd=HERE, env=env, check=True)
+        import_samples.append(time.perf_counter() - start)
+        start = time.perf_counter()
+        subprocess.run([sys.executable, SCRIPT, "--batch", "-", "--text-only"], input="exit\n", text=True,
+                       cwd=env["ISHA_BENCH_DIR"], env=env, check=True, stdout=subprocess.DEVNULL)
+        batch_samples.append(time.perf_counter() - start)
+    return {"import": percentiles(import_samples), "batch_exit": percentiles(batch_samples)}
+
+
+def run_benchmarks(args):
+    """Set up the stand-ins, run every scenario and return the results."""
+    workdir = tempfile.mkdtemp(prefix="isha-bench-")
+    bindir = os.path.join(workdir, "bin")
+    os.mkdir(bindir)
+    install_stub_binaries(bindir, args.subprocess_latency / 1000)
+    server = start_stub_server(args.http_latency / 1000)
+    base_url = f"http://127.0.0.1:{server.server_port}"
+
+    env = dict(os.environ)
+    env.update({
+        "PATH": bindir + os.pathsep + env.get("PATH", ""),
+        "GEMINI_API_KEY": "benchmark",
+        "ISHA_GEMINI_URL": f"{base_url}/v1beta/models/stub",
+        "ISHA_WEATHER_URL": base_url,
+        "ISHA_PROBE_HOSTS": f"127.0.0.1:{server.server_port}",
+        "ISHA_CACHE_PATH": os.path.join(workdir, "cache.sqlite3"),
+        "ISHA_WEATHER_CACHE_PATH": os.path.join(workdir, "weather.json"),
+        "ISHA_HISTORY_PATH": os.path.join(workdir, "history.tsv"),
+        "ISHA_BENCH_DIR": workdir,
+        "PYTHONPATH": HERE + os.pathsep + env.get("PYTHONPATH", ""),
+    })
+    os.environ.update(env)
+    os.chdir(workdir)
+    sys.path.insert(0, HERE)
+    import isha_assistant_termux as isha
+
+    assistant = isha.IshaAssistant(text_only=True, voice=False)
+    assistant.check_internet()
+    counter = itertools.count()
+    results = {}
+
+    def scenario(name, func, iterations=args.iterations):
+        with open(os.devnull, "w") as devnull, contextlib.redirect_stdout(devnull):
+            results[name] = measure(func, iterations)
+            # Let background launches finish (and announce themselves) before the next scenario
+            assistant.jobs.wait(30)
+        print(f"{name:<28} p50 {results[name]['p50_ms']:9.3f} ms  p95 {results[name]['p95_ms']:9.3f} ms  "
+              f"p99 {results[name]['p99_ms']:9.3f} ms")
+
+    slow = max(5, args.iterations // 10)
+    scenario("dispatch.resolve", lambda: isha.COMMANDS.resolve("gili gili chu"))
+    scenario("dispatch.fuzzy", lambda: isha.COMMANDS.resolve("isha opne gogle"))
+    scenario("process_command.time", lambda: assistant.process_command("time"))
+    scenario("solve_math.arithmetic", lambda: assistant.solve_math("12*(3+4)/7"))
+    try:
+        isha.lazy_import("sympy")
+        scenario("solve_math.symbolic", lambda: assistant.solve_math("x**2+2*x+1"), slow)
+    except ImportError:
+        print(f"{'solve_math.symbolic':<28} skipped (sympy not installed)")
+    scenario("query_gemini_api.miss", lambda: assistant.query_gemini_api(f"explain topic {next(counter)}"), slow)
+    scenario("query_gemini_api.hit", lambda: assistant.query_gemini_api("explain topic 0"))
+    assistant.stream = True
+    scenario("query_gemini_api.stream", lambda: assistant.query_gemini_api(f"explain topic {next(counter)}"), slow)
+    assistant.stream = False
+
+    def weather(city):
+        assistant.input_lines = iter([city])
+        assistant.get_weather()
+
+    scenario("get_weather.fetch", lambda: weather(f"city{next(counter)}"), slow)
+    scenario("get_weather.cached", lambda: weather("city0"))
+    scenario("play_song", assistant.play_song, slow)
+    scenario("history.append", lambda: assistant.history.append(f"explain topic {next(counter)}", "query_gemini_api"))
+    scenario("history.search", lambda: assistant.search_history("explain"))
+    assistant.history.append("time", "get_time")
+    scenario("repeat_command", assistant.repeat_command)
+    assistant.shutdown()
+
+    print("measuring startup...")
+    results["startup"] = measure_startup(env, args.startup_runs)
+    server.shutdown()
+    return {
+        "meta": {
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "iterations": args.iterations,
+            "http_latency_ms": args.http_latency,
+            "subprocess_latency_ms": args.subprocess_latency,
+            "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        },
+        "results": results,
+    }
+
+
+def compare(current, baseline_path):
+    """Print the p50/p95 change of every scenario against an earlier run."""
+    with open(baseline_path, "r") as f:
+        baseline = json.load(f)["results"]
+    print(f"\n{'scenario':<28} {'p50 before':>11} {'p50 after':>11} {'change':>8}")
+    for name, result in current["results"].items():
+        if name == "startup" or name not in baseline:
+            continue
+        before = baseline[name]["p50_ms"]
+        after = result["p50_ms"]
+        change = (after - before) / before * 100 if before else 0.0
+        print(f"{name:<28} {before:11.3f} {after:11.3f} {change:+7.1f}%")
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmark Isha Assistant handlers with local stand-ins")
+    parser.add_argument("--iterations", type=int, default=200, help="samples per fast scenario")
+    parser.add_argument("--http-latency", type=float, default=20, help="stub HTTP server delay in ms")
+    parser.add_argument("--subprocess-latency", type=float, default=0, help="stub termux-* delay in ms")
+    parser.add_argument("--startup-runs", type=int, default=5, help="cold starts to time")
+    parser.add_argument("--output", metavar="FILE", help="save results as JSON")
+    parser.add_argument("--compare", metavar="FILE", help="compare with results saved by an earlier run")
+    args = parser.parse_args(argv)
+    # The benchmark runs inside a scratch directory, so resolve paths first.
+    args.output = args.output and os.path.abspath(args.output)
+    args.compare = args.compare and os.path.abspath(args.compare)
+
+    report = run_benchmarks(args)
+    startup = report["results"]["startup"]
+    print(f"{'startup.import':<28} p50 {startup['import']['p50_ms']:9.3f} ms")
+    print(f"{'startup.batch_exit':<28} p50 {startup['batch_exit']['p50_ms']:9.3f} ms")
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(report, f, indent=2)
+        print(f"Saved results to {args.output}")
+    if args.compare:
+        compare(report, args.compare)
+
+
+if __name__ == "__main__":
+    main()
@@ -1,73 +1,2245 @@
-```python
+import time
+
+_PROCESS_START = time.perf_counter()
+
 import datetime
 import os
-import webbrowser
-import time
+import sys
 import random
 import subprocess
 import re
 import threading
-import requests
-from sympy import sympify, sin, cos, tan, sqrt, pi
+import importlib
+import collections
 import socket
-import glob
 import logging
-from dotenv import load_dotenv
-import pywhatkit
+import json
+import sqlite3
+import selectors
+import errno
+import ast
+import math
+import operator
+import functools
+import multiprocessing
+import io
+import contextlib
+import queue
+import atexit
+import logging.handlers
+import itertools
+import concurrent.futures
+import socketserver
+import inspect
+import bisect
+
+# Heavy third-party modules (requests, sympy, pywhatkit, dotenv) are imported
+# on first use through lazy_import() so that a plain launch stays fast.
+PREWARM_MODULES = ["requests", "sympy"]
+STARTUP_BUDGET_MS = float(os.getenv("ISHA_STARTUP_BUDGET_MS", "250"))
+
+# Endpoints can be pointed at a local stub server for testing.
+GEMINI_MODEL_URL = os.getenv("ISHA_GEMINI_URL",
+                             "https://generativelanguage.googleapis.com/v1beta/models/gemini-1.5-flash")
+WEATHER_URL = os.getenv("ISHA_WEATHER_URL", "https://wttr.in")
+HTTP_CONNECT_TIMEOUT = float(os.getenv("ISHA_CONNECT_TIMEOUT", "5"))
+HTTP_READ_TIMEOUT = float(os.getenv("ISHA_READ_TIMEOUT", "30"))
+
+# Hosts probed by the connectivity monitor, as "host:port" pairs.
+PROBE_HOSTS = [
+    (host, int(port)) for host, port in
+    (item.rsplit(":", 1) for item in os.getenv("ISHA_PROBE_HOSTS", "8.8.8.8:80,1.1.1.1:80").split(","))
+]
+
+WEATHER_CACHE_PATH = os.getenv("ISHA_WEATHER_CACHE_PATH", "weather_cache.json")
+WEATHER_CACHE_SIZE = int(os.getenv("ISHA_WEATHER_CACHE_SIZE", "20"))
+WEATHER_REFRESH_AFTER = float(os.getenv("ISHA_WEATHER_REFRESH_AFTER", "600"))
+WEATHER_MAX_AGE = float(os.getenv("ISHA_WEATHER_MAX_AGE", "3600"))
+WEATHER_PREFETCH_CITIES = int(os.getenv("ISHA_WEATHER_PREFETCH", "3"))
+
+MATH_TIMEOUT = float(os.getenv("ISHA_MATH_TIMEOUT", "3"))
+MATH_MEMORY_MB = int(os.getenv("ISHA_MATH_MEMORY_MB", "256"))
+
+STT_COMMAND = os.getenv("ISHA_STT_COMMAND", "termux-speech-to-text")
+VOICE_PREARM = os.getenv("ISHA_VOICE_PREARM", "1") not in ("", "0")
+
+MEDIA_INDEX_PATH = os.getenv("ISHA_MEDIA_INDEX_PATH", "media_index.json")
+MUSIC_DIRS = os.getenv("ISHA_MUSIC_DIRS", os.path.join(os.path.expanduser("~"), "music")).split(os.pathsep)
+VIDEO_DIRS = os.getenv("ISHA_VIDEO_DIRS", os.path.join(os.path.expanduser("~"), "videos")).split(os.pathsep)
+MEDIA_EXTENSIONS = {
+    "music": {".mp3", ".wav", ".m4a", ".aac", ".flac", ".ogg", ".opus", ".wma", ".amr"},
+    "video": {".mp4", ".mkv", ".webm", ".avi", ".mov", ".3gp", ".m4v"},
+}
+
+JOB_WORKERS = int(os.getenv("ISHA_JOB_WORKERS", "2"))
+JOB_LIMIT = int(os.getenv("ISHA_JOB_LIMIT", "16"))
+
+SOCKET_PATH = os.getenv("ISHA_SOCKET_PATH", os.path.join(os.getenv("TMPDIR", "/tmp"), "isha_assistant.sock"))
+
+COMMAND_TIMEOUT = float(os.getenv("ISHA_COMMAND_TIMEOUT", "60"))
+MAX_IN_FLIGHT = int(os.getenv("ISHA_MAX_IN_FLIGHT", "4"))
+
+HISTORY_PATH = os.getenv("ISHA_HISTORY_PATH", "isha_history.tsv")
+HISTORY_SIZE = int(os.getenv("ISHA_HISTORY_SIZE", "1000"))
+HISTORY_WARM_QUERIES = int(os.getenv("ISHA_HISTORY_WARM_QUERIES", "3"))
+
+LOG_PATH = os.getenv("ISHA_LOG_PATH", "isha_assistant.log")
+LOG_MAX_BYTES = int(os.getenv("ISHA_LOG_MAX_BYTES", str(1024 * 1024)))
+LOG_BACKUPS = int(os.getenv("ISHA_LOG_BACKUPS", "3"))
+STATS_PATH = os.getenv("ISHA_STATS_PATH", "isha_stats.json")
+
+RESPONSE_CACHE_PATH = os.getenv("ISHA_CACHE_PATH", "isha_cache.sqlite3")
+RESPONSE_CACHE_TTL = float(os.getenv("ISHA_CACHE_TTL", str(7 * 24 * 3600)))
+RESPONSE_CACHE_SIZE = int(os.getenv("ISHA_CACHE_SIZE", "500"))
+
+
+class StartupTimer:
+    """Collects named timing phases for the cold-start report."""
+    def __init__(self):
+        self.phases = []
+        self.lock = threading.Lock()
+
+    def record(self, name, seconds):
+        with self.lock:
+            self.phases.append((name, seconds))
+
+    def phase(self, name):
+        """Return a context manager that records the time spent in a block."""
+        timer = self
+
+        class _Phase:
+            def __enter__(self):
+                self.start = time.perf_counter()
+                return self
+
+            def __exit__(self, *exc):
+                timer.record(name, time.perf_counter() - self.start)
+                return False
+
+        return _Phase()
+
+    def report(self, budget_ms=STARTUP_BUDGET_MS):
+        """Format the recorded phases and compare the total with the budget."""
+        with self.lock:
+            phases = list(self.phases)
+        total_ms = (time.perf_counter() - _PROCESS_START) * 1000
+        lines = ["Startup timing report:"]
+        for name, seconds in phases:
+            lines.append(f"  {name:<28} {seconds * 1000:8.1f} ms")
+        status = "within" if total_ms <= budget_ms else "OVER"
+        lines.append(f"  {'total (to prompt)':<28} {total_ms:8.1f} ms ({status} budget of {budget_ms:.0f} ms)")
+        return "\n".join(lines)
+
+
+STARTUP_TIMER = StartupTimer()
+STARTUP_TIMER.record("stdlib imports", time.perf_counter() - _PROCESS_START)
+
+_LAZY_MODULES = {}
+_LAZY_LOCK = threading.Lock()
+
+
+def lazy_import(name):
+    """Import a module on first use; later calls return the cached module."""
+    module = _LAZY_MODULES.get(name)
+    if module is not None:
+        return module
+    with _LAZY_LOCK:
+        module = _LAZY_MODULES.get(name)
+        if module is None:
+            with STARTUP_TIMER.phase(f"import {name}"), METRICS.span("import"):
+                module = importlib.import_module(name)
+            _LAZY_MODULES[name] = module
+    return module
+
+
+def prewarm_imports(modules=None):
+    """Import heavy modules in a background thread once the prompt is up."""
+    def worker():
+        for name in modules or PREWARM_MODULES:
+            try:
+                lazy_import(name)
+            except Exception as e:
+                logging.warning(f"Pre-warm import of {name} failed: {str(e)}")
+
+    thread = threading.Thread(target=worker, name="isha-prewarm", daemon=True)
+    thread.start()
+    return thread
+
+
+def load_env():
+    """Load variables from a .env file if python-dotenv is installed."""
+    try:
+        lazy_import("dotenv").load_dotenv()
+    except ImportError:
+        pass
+
+
+_LOG_LISTENER = None
+
+
+def setup_logging(path=LOG_PATH, max_bytes=LOG_MAX_BYTES, backups=LOG_BACKUPS):
+    """Send log records through a queue to a rotating file written by a background thread."""
+    global _LOG_LISTENER
+    if _LOG_LISTENER is not None:
+        return _LOG_LISTENER
+    file_handler = logging.handlers.RotatingFileHandler(path, maxBytes=max_bytes, backupCount=backups,
+                                                        encoding="utf-8", delay=True)
+    file_handler.setFormatter(logging.Formatter("%(asctime)s - %(levelname)s - %(message)s"))
+    log_queue = queue.SimpleQueue()
+    root = logging.getLogger()
+    root.setLevel(logging.INFO)
+    root.addHandler(logging.handlers.QueueHandler(log_queue))
+    _LOG_LISTENER = logging.handlers.QueueListener(log_queue, file_handler)
+    _LOG_LISTENER.start()
+    atexit.register(_LOG_LISTENER.stop)
+    return _LOG_LISTENER
+
+
+HISTOGRAM_BOUNDS_MS = [1, 2, 5, 10, 20, 50, 100, 200, 500, 1000, 2000, 5000, 10000, 30000]
+
+
+class Histogram:
+    """Fixed-bucket latency histogram in milliseconds."""
+    def __init__(self):
+        self.buckets = [0] * (len(HISTOGRAM_BOUNDS_MS) + 1)
+        self.count = 0
+        self.total_ms = 0.0
+        self.max_ms = 0.0
+
+    def add(self, ms):
+        index = 0
+        while index < len(HISTOGRAM_BOUNDS_MS) and ms > HISTOGRAM_BOUNDS_MS[index]:
+            index += 1
+        self.buckets[index] += 1
+        self.count += 1
+        self.total_ms += ms
+        self.max_ms = max(self.max_ms, ms)
+
+    def quantile(self, q):
+        """Return the upper bound of the bucket holding the q-th quantile."""
+        if not self.count:
+            return 0.0
+        target = q * self.count
+        seen = 0
+        for index, count in enumerate(self.buckets):
+            seen += count
+            if seen >= target:
+                return HISTOGRAM_BOUNDS_MS[index] if index < len(HISTOGRAM_BOUNDS_MS) else self.max_ms
+        return self.max_ms
+
+    def to_dict(self):
+        return {
+            "count": self.count,
+            "mean_ms": round(self.total_ms / self.count, 3) if self.count else 0.0,
+            "p50_ms": self.quantile(0.5),
+            "p95_ms": self.quantile(0.95),
+            "max_ms": round(self.max_ms, 3),
+            "buckets": dict(zip([str(bound) for bound in HISTOGRAM_BOUNDS_MS] + ["inf"], self.buckets)),
+        }
+
+
+class Metrics:
+    """Counters, latency histograms and per-command timing spans.
+
+    Spans opened while a command is being processed on the same thread
+    are added to that command's breakdown, which is logged when it ends.
+    """
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.counters = collections.Counter()
+        self.histograms = collections.defaultdict(Histogram)
+        self.local = threading.local()
+
+    def incr(self, name, amount=1):
+        with self.lock:
+            self.counters[name] += amount
+
+    def observe(self, name, seconds):
+        with self.lock:
+            self.histograms[name].add(seconds * 1000)
+
+    @contextlib.contextmanager
+    def span(self, phase):
+        """Time a block as phase, both globally and for the current command."""
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            elapsed = time.perf_counter() - start
+            self.observe(f"phase.{phase}", elapsed)
+            spans = getattr(self.local, "spans", None)
+            if spans is not None:
+                spans[phase] = spans.get(phase, 0.0) + elapsed
+
+    def begin_command(self):
+        self.local.spans = {}
+        self.local.start = time.perf_counter()
+
+    def end_command(self, command, handler, error=False):
+        elapsed = time.perf_counter() - self.local.start
+        spans = self.local.spans
+        self.local.spans = None
+        self.incr("commands")
+        if error:
+            self.incr("errors")
+        self.observe("command", elapsed)
+        self.observe(f"handler.{handler}", elapsed)
+        breakdown = ", ".join(f"{phase} {seconds * 1000:.1f} ms" for phase, seconds in spans.items())
+        logging.info(f"Command {command!r} handled by {handler} in {elapsed * 1000:.1f} ms ({breakdown or 'no spans'})")
+
+    def snapshot(self):
+        with self.lock:
+            return {
+                "counters": dict(self.counters),
+                "histograms": {name: histogram.to_dict() for name, histogram in sorted(self.histograms.items())},
+            }
+
+    def dump(self, path=STATS_PATH, extra=None):
+        """Write the snapshot (plus any extra sections) to a JSON file."""
+        data = self.snapshot()
+        data.update(extra or {})
+        try:
+            with open(path, "w") as f:
+                json.dump(data, f, indent=2)
+        except OSError as e:
+            logging.error(f"Failed to write stats to {path}: {str(e)}")
+        return data
+
+
+METRICS = Metrics()
+
+
+FILLER_WORDS = {"isha", "please", "plz", "pls", "kindly", "hey", "ok", "okay", "just", "can", "could", "would",
+                "you", "tell", "me", "the", "a", "an", "now"}
+# Chat-style abbreviations expanded before matching
+ABBREVIATIONS = {"u": "you", "ur": "your", "r": "are", "wat": "what", "plz": "please", "pls": "please"}
+FUZZY_THRESHOLD = float(os.getenv("ISHA_FUZZY_THRESHOLD", "0.7"))
+# Score needed to override a question prefix such as "what is " that goes to Gemini
+FUZZY_PREFIX_THRESHOLD = float(os.getenv("ISHA_FUZZY_PREFIX_THRESHOLD", "0.9"))
+
+
+def edit_distance(a, b, limit):
+    """Optimal string alignment distance, or limit + 1 once it exceeds limit."""
+    if abs(len(a) - len(b)) > limit:
+        return limit + 1
+    previous2 = None
+    previous = list(range(len(b) + 1))
+    for i in range(1, len(a) + 1):
+        current = [i] + [0] * len(b)
+        for j in range(1, len(b) + 1):
+            cost = a[i - 1] != b[j - 1]
+            current[j] = min(previous[j] + 1, current[j - 1] + 1, previous[j - 1] + cost)
+            if i > 1 and j > 1 and a[i - 1] == b[j - 2] and a[i - 2] == b[j - 1]:
+                current[j] = min(current[j], previous2[j - 2] + 1)
+        if min(current) > limit:
+            return limit + 1
+        previous2, previous = previous, current
+    return previous[-1]
+
+
+def allowed_typos(token):
+    return 0 if len(token) <= 3 else 1 if len(token) <= 6 else 2
+
+
+def trigrams(tokens):
+    grams = set()
+    for token in tokens:
+        padded = f"${token}$"
+        grams.update(padded[i:i + 3] for i in range(len(padded) - 2))
+    return grams
+
+
+class FuzzyMatcher:
+    """Maps misspelled or padded commands to a registered phrase.
+
+    Phrases are normalized (punctuation and filler words such as "isha",
+    "please" and "the" removed) and indexed by character trigrams. A
+    command is compared only with phrases sharing trigrams with it; the
+    best few are rescored by per-word edit distance, and the winner is
+    accepted if its score reaches the threshold.
+    """
+    def __init__(self, phrases, threshold=FUZZY_THRESHOLD, candidates=5):
+        self.threshold = threshold
+        self.candidates = candidates
+        self.exact = {}
+        self.entries = []
+        self.index = {}
+        ambiguous = set()
+        for phrase, func in phrases.items():
+            tokens = self.normalize(phrase)
+            if not tokens:
+                continue
+            key = " ".join(tokens)
+            if key in self.exact and self.exact[key][1] is not func:
+                ambiguous.add(key)
+                continue
+            self.exact[key] = (phrase, func)
+        for key in ambiguous:
+            del self.exact[key]
+        for key, (phrase, func) in self.exact.items():
+            tokens = key.split()
+            grams = trigrams(tokens)
+            entry_id = len(self.entries)
+            self.entries.append((phrase, func, tokens, len(grams)))
+            for gram in grams:
+                self.index.setdefault(gram, []).append(entry_id)
+
+    @staticmethod
+    def normalize(text):
+        words = re.sub(r"[^\w\s]", "", text.lower()).split()
+        words = [ABBREVIATIONS.get(word, word) for word in words]
+        return [word for word in words if word not in FILLER_WORDS]
+
+    def match(self, command, usage=None, threshold=None):
+        """Return (phrase, handler, score) for the best match, or None.
+
+        usage optionally maps handler names to their share of past commands;
+        it breaks near-ties in favour of habitually used handlers. threshold
+        overrides the matcher's own minimum score.
+        """
+        tokens = self.normalize(command)
+        if not tokens:
+            return None
+        hit = self.exact.get(" ".join(tokens))
+        if hit is not None:
+            return hit[0], hit[1], 1.0
+        grams = trigrams(tokens)
+        shared = collections.Counter()
+        for gram in grams:
+            for entry_id in self.index.get(gram, ()):
+                shared[entry_id] += 1
+        best = None
+        best_rank = None
+        for entry_id, count in shared.most_common(self.candidates):
+            phrase, func, phrase_tokens, gram_count = self.entries[entry_id]
+            dice = 2 * count / (len(grams) + gram_count)
+            score = 0.4 * dice + 0.6 * self._word_score(tokens, phrase_tokens)
+            rank = score + (0.05 * usage.get(func.__name__, 0.0) if usage else 0.0)
+            if best_rank is None or rank > best_rank:
+                best, best_rank = (phrase, func, score), rank
+        if best is not None and best[2] >= (self.threshold if threshold is None else threshold):
+            return best
+        return None
+
+    @staticmethod
+    def _word_score(tokens, phrase_tokens):
+        """Credit each phrase word found in the command, penalizing extra words."""
+        unused = list(tokens)
+        credit = 0.0
+        for word in phrase_tokens:
+            if word in unused:
+                unused.remove(word)
+                credit += 1.0
+                continue
+            limit = allowed_typos(word)
+            if not limit:
+                continue
+            for candidate in unused:
+                distance = edit_distance(word, candidate, limit)
+                if distance <= limit:
+                    unused.remove(candidate)
+                    credit += 1.0 - 0.1 * distance
+                    break
+            else:
+                # A word split in two, like "whats app" for "whatsapp"
+                for i in range(len(unused) - 1):
+                    distance = edit_distance(word, unused[i] + unused[i + 1], limit)
+                    if distance <= limit:
+                        del unused[i:i + 2]
+                        credit += 0.9 - 0.1 * distance
+                        break
+        coverage = credit / len(phrase_tokens)
+        return coverage * len(phrase_tokens) / (len(phrase_tokens) + len(unused))
+
+
+# Real-world misspellings and padded commands with the handler they should
+# reach (None means the command should still go to Gemini).
+FUZZY_CORPUS = [
+    ("opne google", "open_google"),
+    ("open gogle", "open_google"),
+    ("isha opn google", "open_google"),
+    ("isha please tell the time", "get_time"),
+    ("tell me the time please", "get_time"),
+    ("wat is the time", "get_time"),
+    ("wat is teh date", "get_date"),
+    ("aaj date kya hai isha", "get_date"),
+    ("samay kya ho raha hai", "get_time"),
+    ("yutube", "open_youtube"),
+    ("isha youtub", "open_youtube"),
+    ("instagarm", "open_instagram"),
+    ("isha open instagarm", "open_instagram"),
+    ("gili gili chuu", "open_instagram"),
+    ("download instagaram reel", "download_instagram_reel"),
+    ("isha download instgram stories", "download_instagram_reel"),
+    ("downlod photo", "download_picture"),
+    ("whatsap", "open_whatsapp"),
+    ("isha whats app", "open_whatsapp"),
+    ("helo isha", "hello"),
+    ("thank u isha", "thank_you_reply"),
+    ("thanku isha", "thank_you_reply"),
+    ("whats your name", "what_is_your_name"),
+    ("what is ur name", "what_is_your_name"),
+    ("good mornig", "morningtime"),
+    ("stop musik", "stop_song"),
+    ("isha stop the song", "stop_song"),
+    ("play a song", "play_song"),
+    ("isha play musc", "play_song"),
+    ("wether", "get_weather"),
+    ("isha weather please", "get_weather"),
+    ("aaj ka mosam kya hai", "get_weather"),
+    ("open file explrer", "open_file_explorer"),
+    ("open downlods", "open_downloads"),
+    ("serch now", "find_now"),
+    ("manoranjan shuru kiya jaaye", "open_youtube"),
+    ("isha show stats", "show_stats"),
+    ("what is time", "get_time"),
+    ("how tall is mount everest", "query_gemini_api"),
+    ("who is the prime minister of india", "query_gemini_api"),
+    ("write a poem about rain", "query_gemini_api"),
+    ("don't stop me now", "query_gemini_api"),
+    ("translate good morning to french", "query_gemini_api"),
+    ("how do i open a jar", "query_gemini_api"),
+    ("what is a date palm", "query_gemini_api"),
+    ("what is the name of the moon", "query_gemini_api"),
+    ("history of india", "query_gemini_api"),
+    ("repeat after me", "query_gemini_api"),
+]
+
+
+def evaluate_fuzzy_matcher(registry=None, corpus=FUZZY_CORPUS):
+    """Dispatch each corpus case as a real command; print the results, accuracy and mean time."""
+    registry = registry or COMMANDS
+    registry.matcher()
+    failures = 0
+    start = time.perf_counter()
+    results = [(command, expected, registry.resolve(command)[0]) for command, expected in corpus]
+    elapsed = time.perf_counter() - start
+    for command, expected, handler in results:
+        ok = handler.__name__ == expected
+        failures += not ok
+        print(f"{'ok  ' if ok else 'FAIL'} {command!r:<40} -> {handler.__name__}")
+    print(f"{len(corpus) - failures}/{len(corpus)} correct, {elapsed / len(corpus) * 1e6:.1f} us per command")
+    return failures == 0
+
+
+class CommandRegistry:
+    """Indexes command phrases, prefixes and regex patterns to their handlers.
+
+    Exact phrases live in a dict so lookup cost does not grow with the number
+    of aliases. Prefixes are bucketed by length and checked longest first,
+    and patterns are compiled once at registration time.
+    """
+    def __init__(self):
+        self.phrases = {}
+        self.prefixes = {}
+        self.prefix_lengths = []
+        self.patterns = []
+        self.default = None
+        self.interactive_handlers = set()
+        # Optional callable returning {handler name: share of past commands}
+        self.usage = None
+        self._matcher = None
+
+    def phrase(self, *phrases):
+        """Register a handler for one or more exact command phrases."""
+        def decorator(func):
+            for phrase in phrases:
+                if phrase in self.phrases:
+                    raise ValueError(f"Command phrase already registered: {phrase!r}")
+                self.phrases[phrase] = func
+            self._matcher = None
+            return func
+        return decorator
+
+    def prefix(self, *prefixes, strip=False):
+        """Register a handler for commands starting with a prefix.
+
+        The handler receives the full command, or only the text after the
+        prefix when strip is true.
+        """
+        def decorator(func):
+            for prefix in prefixes:
+                self.prefixes[prefix] = (func, strip)
+                if len(prefix) not in self.prefix_lengths:
+                    self.prefix_lengths.append(len(prefix))
+                    self.prefix_lengths.sort(reverse=True)
+            return func
+        return decorator
+
+    def pattern(self, regex):
+        """Register a handler for commands matching a regular expression."""
+        def decorator(func):
+            self.patterns.append((re.compile(regex), func))
+            return func
+        return decorator
+
+    def interactive(self, func):
+        """Mark a handler that asks follow-up questions through listen()."""
+        self.interactive_handlers.add(func)
+        return func
+
+    def is_interactive(self, func):
+        return func in self.interactive_handlers
+
+    def fallback(self, func):
+        """Register the handler for commands nothing else matches."""
+        self.default = func
+        return func
+
+    def resolve(self, command):
+        """Return (handler, args) for a command."""
+        func = self.phrases.get(command)
+        if func is not None:
+            return func, ()
+        for length in self.prefix_lengths:
+            entry = self.prefixes.get(command[:length])
+            if entry is not None:
+                func, strip = entry
+                if func is self.default:
+                    # "what is ur name" starts like a question but is a command
+                    match = self.matcher().match(command, self.usage() if self.usage else None,
+                                                 FUZZY_PREFIX_THRESHOLD)
+                    if match is not None:
+                        phrase, func, score = match
+                        logging.info(f"Fuzzy matched {command!r} to {phrase!r} (score {score:.2f})")
+                        return func, ()
+                return func, (command[length:] if strip else command,)
+        for regex, func in self.patterns:
+            if regex.match(command):
+                return func, (command,)
+        match = self.matcher().match(command, self.usage() if self.usage else None)
+        if match is not None:
+            phrase, func, score = match
+            logging.info(f"Fuzzy matched {command!r} to {phrase!r} (score {score:.2f})")
+            return func, ()
+        return self.default, (command,)
+
+    def matcher(self):
+        """Return the fuzzy matcher for the registered phrases, building it once."""
+        if self._matcher is None:
+            self._matcher = FuzzyMatcher(self.phrases)
+        return self._matcher
+
+
+COMMANDS = CommandRegistry()
+
+
+SENTENCE_END = re.compile(r"(?<=[.!?])\s+")
+
+
+def split_sentences(text, max_chars=300):
+    """Split text into sentence chunks no longer than max_chars."""
+    chunks = []
+    for sentence in SENTENCE_END.split(text.strip()):
+        while len(sentence) > max_chars:
+            cut = sentence.rfind(" ", 0, max_chars)
+            if cut <= 0:
+                cut = max_chars
+            chunks.append(sentence[:cut].strip())
+            sentence = sentence[cut:].strip()
+        if sentence:
+            chunks.append(sentence)
+    return chunks
+
+
+class SpeechWorker:
+    """Speaks queued text with termux-tts-speak on a background thread.
+
+    Text is split into sentence chunks and queued without blocking the
+    caller. Short chunks are merged to save process launches, and
+    interrupt() cancels both the queue and the utterance being spoken.
+    Each say() starts a new utterance unless continues is true (streamed
+    sentences of one answer). When more than max_pending chunks are queued,
+    older utterances are dropped whole as stale; the newest utterance is
+    never cut, however long it is.
+    """
+    def __init__(self, enabled=True, max_pending=8, chunk_chars=300):
+        self.enabled = enabled
+        self.chunk_chars = chunk_chars
+        self.max_pending = max_pending
+        # [utterance id, text] pairs, oldest first
+        self.pending = collections.deque()
+        self.utterances = itertools.count()
+        self.current = None
+        self.cond = threading.Condition()
+        self.process = None
+        self.busy = False
+        self.closed = False
+        self.thread = None
+        if enabled:
+            self.thread = threading.Thread(target=self._run, name="isha-speech", daemon=True)
+            self.thread.start()
+
+    def say(self, text, continues=False):
+        """Queue text to be spoken and return immediately.
+
+        continues adds the text to the previous utterance instead of
+        starting a new one.
+        """
+        if not self.enabled or not text:
+            return
+        with self.cond:
+            if not continues or self.current is None:
+                self.current = next(self.utterances)
+            for chunk in split_sentences(text, self.chunk_chars):
+                last = self.pending[-1] if self.pending else None
+                if last is not None and last[0] == self.current and len(last[1]) + len(chunk) < self.chunk_chars:
+                    last[1] = f"{last[1]} {chunk}"
+                else:
+                    self.pending.append([self.current, chunk])
+            while len(self.pending) > self.max_pending and self.pending[0][0] != self.current:
+                # Drop the oldest earlier utterance as a whole, never half of one
+                stale = self.pending[0][0]
+                while self.pending and self.pending[0][0] == stale:
+                    logging.info(f"Dropping stale speech: {self.pending.popleft()[1]}")
+            self.cond.notify()
+
+    def interrupt(self):
+        """Drop pending speech and stop the current utterance."""
+        with self.cond:
+            self.pending.clear()
+            process = self.process
+        if process is not None and process.poll() is None:
+            process.terminate()
+
+    def wait(self, timeout=None):
+        """Block until everything queued has been spoken or timeout expires."""
+        deadline = None if timeout is None else time.monotonic() + timeout
+        with self.cond:
+            while self.pending or self.busy:
+                remaining = None if deadline is None else deadline - time.monotonic()
+                if remaining is not None and remaining <= 0:
+                    return False
+                self.cond.wait(remaining)
+        return True
+
+    def close(self, timeout=5):
+        """Finish queued speech (up to timeout) and stop the worker."""
+        if self.thread is None:
+            return
+        self.wait(timeout)
+        self.interrupt()
+        with self.cond:
+            self.closed = True
+            self.cond.notify_all()
+        self.thread.join(timeout)
+
+    def _run(self):
+        while True:
+            with self.cond:
+                while not self.pending and not self.closed:
+                    self.cond.wait()
+                if self.closed:
+                    return
+                _, text = self.pending.popleft()
+                self.busy = True
+            try:
+                self._speak_now(text)
+            finally:
+                with self.cond:
+                    self.busy = False
+                    self.process = None
+                    self.cond.notify_all()
+
+    def _speak_now(self, text):
+        try:
+            process = subprocess.Popen(["termux-tts-speak", text],
+                                       stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+        except OSError as e:
+            logging.error(f"Speech error: {str(e)}. Switching to text-only output.")
+            self.enabled = False
+            with self.cond:
+                self.pending.clear()
+            return
+        with self.cond:
+            self.process = process
+        start = time.perf_counter()
+        returncode = process.wait()
+        METRICS.observe("tts", time.perf_counter() - start)
+        if returncode > 0:
+            logging.error(f"Speech error: termux-tts-speak exited with status {returncode}")
+
+
+class HttpClient:
+    """A shared keep-alive requests session with timeouts and retries.
+
+    The session is created on first use so that requests is only imported
+    when a command actually needs the network. Connection errors, timeouts
+    and 429/5xx responses are retried with exponential backoff. Requests
+    that are not idempotent, such as the Gemini POST, are only retried when
+    the connection could not be made, so a slow reply is never sent twice.
+    """
+    RETRY_STATUS = (429, 500, 502, 503, 504)
+    IDEMPOTENT_METHODS = ("GET", "HEAD", "OPTIONS", "PUT", "DELETE")
+
+    def __init__(self, connect_timeout=HTTP_CONNECT_TIMEOUT, read_timeout=HTTP_READ_TIMEOUT,
+                 retries=2, backoff=0.5, check_online=None):
+        self.timeout = (connect_timeout, read_timeout)
+        self.retries = retries
+        # Called after a connection error or timeout; returning False stops the retries
+        self.check_online = check_online
+        self.backoff = backoff
+        self._session = None
+        self._lock = threading.Lock()
+
+    @property
+    def session(self):
+        if self._session is None:
+            with self._lock:
+                if self._session is None:
+                    requests = lazy_import("requests")
+                    session = requests.Session()
+                    adapter = requests.adapters.HTTPAdapter(pool_connections=4, pool_maxsize=8)
+                    session.mount("http://", adapter)
+                    session.mount("https://", adapter)
+                    self._session = session
+        return self._session
+
+    def request(self, method, url, **kwargs):
+        """Send a request, retrying transient failures, and return the response."""
+        requests = lazy_import("requests")
+        kwargs.setdefault("timeout", self.timeout)
+        for attempt in range(self.retries + 1):
+            last_attempt = attempt == self.retries
+            try:
+                with METRICS.span("network"):
+                    response = self.session.request(method, url, **kwargs)
+            except (requests.exceptions.ConnectionError, requests.exceptions.Timeout) as e:
+                if method.upper() not in self.IDEMPOTENT_METHODS and not self._not_connected(e):
+                    raise
+                if last_attempt or (self.check_online is not None and not self.check_online()):
+                    raise
+                logging.warning(f"HTTP {method} {url} failed ({str(e)}), retrying")
+            else:
+                if response.status_code not in self.RETRY_STATUS or last_attempt:
+                    response.raise_for_status()
+                    return response
+                logging.warning(f"HTTP {method} {url} returned {response.status_code}, retrying")
+                response.close()
+            time.sleep(self.backoff * (2 ** attempt))
+
+    @staticmethod
+    def _not_connected(error):
+        """Return True if the request failed before it reached the server."""
+        requests = lazy_import("requests")
+        if isinstance(error, requests.exceptions.ConnectTimeout):
+            return True
+        reason = getattr(error.args[0], "reason", None) if error.args else None
+        return isinstance(reason, requests.packages.urllib3.exceptions.NewConnectionError)
+
+    def get(self, url, **kwargs):
+        return self.request("GET", url, **kwargs)
+
+    def post(self, url, **kwargs):
+        return self.request("POST", url, **kwargs)
+
+    def close(self):
+        if self._session is not None:
+            self._session.close()
+            self._session = None
+
+
+def gemini_text(result):
+    """Extract the generated text from a Gemini response object."""
+    return result.get("candidates", [{}])[0].get("content", {}).get("parts", [{}])[0].get("text", "")
+
+
+def normalize_query(query):
+    """Reduce a query to a cache key: lower case, no punctuation, single spaces."""
+    return " ".join(re.sub(r"[^\w\s]", " ", query.lower()).split())
+
+
+class ResponseCache:
+    """A SQLite-backed cache of AI answers with per-entry TTL and LRU eviction.
+
+    Entries past their TTL are misses for normal lookups but can still be
+    returned with allow_stale=True, which is how offline queries are served.
+    """
+    def __init__(self, path=RESPONSE_CACHE_PATH, ttl=RESPONSE_CACHE_TTL, max_entries=RESPONSE_CACHE_SIZE):
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self.hits = 0
+        self.misses = 0
+        self.lock = threading.Lock()
+        self.db = sqlite3.connect(path, check_same_thread=False)
+        self.db.execute(
+            "CREATE TABLE IF NOT EXISTS responses ("
+            "key TEXT PRIMARY KEY, query TEXT, answer TEXT, expires REAL, last_used REAL)"
+        )
+        self.db.execute("CREATE INDEX IF NOT EXISTS responses_last_used ON responses (last_used)")
+        self.db.commit()
+
+    def get(self, query, allow_stale=False):
+        """Return the cached answer for a query, or None on a miss."""
+        key = normalize_query(query)
+        now = time.time()
+        with self.lock:
+            row = self.db.execute("SELECT answer, expires FROM responses WHERE key = ?", (key,)).fetchone()
+            if row is None or (row[1] < now and not allow_stale):
+                self.misses += 1
+                return None
+            self.db.execute("UPDATE responses SET last_used = ? WHERE key = ?", (now, key))
+            self.db.commit()
+            self.hits += 1
+            return row[0]
+
+    def fresh(self, query):
+        """Return True if an unexpired answer is cached, without touching the counters."""
+        with self.lock:
+            row = self.db.execute("SELECT expires FROM responses WHERE key = ?", (normalize_query(query),)).fetchone()
+        return row is not None and row[0] >= time.time()
+
+    def put(self, query, answer, ttl=None):
+        """Store an answer and evict the least recently used entries over the limit."""
+        now = time.time()
+        expires = now + (self.ttl if ttl is None else ttl)
+        with self.lock:
+            self.db.execute(
+                "INSERT OR REPLACE INTO responses (key, query, answer, expires, last_used) VALUES (?, ?, ?, ?, ?)",
+                (normalize_query(query), query, answer, expires, now),
+            )
+            self.db.execute(
+                "DELETE FROM responses WHERE key IN "
+                "(SELECT key FROM responses ORDER BY last_used DESC LIMIT -1 OFFSET ?)",
+                (self.max_entries,),
+            )
+            self.db.commit()
+
+    def stats(self):
+        """Return hit/miss counters and the current number of entries."""
+        with self.lock:
+            size = self.db.execute("SELECT COUNT(*) FROM responses").fetchone()[0]
+        return {"hits": self.hits, "misses": self.misses, "entries": size}
+
+    def close(self):
+        with self.lock:
+            self.db.close()
+
+
+def probe_hosts(hosts=PROBE_HOSTS, timeout=2):
+    """Try to connect to all hosts at once; True as soon as one accepts."""
+    selector = selectors.DefaultSelector()
+    sockets = []
+    try:
+        for host in hosts:
+            try:
+                sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+            except OSError:
+                continue
+            sockets.append(sock)
+            sock.setblocking(False)
+            code = sock.connect_ex(host)
+            if code == 0:
+                return True
+            if code in (errno.EINPROGRESS, errno.EWOULDBLOCK, errno.EALREADY):
+                selector.register(sock, selectors.EVENT_WRITE)
+        deadline = time.monotonic() + timeout
+        while selector.get_map():
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                break
+            for key, _ in selector.select(remaining):
+                if key.fileobj.getsockopt(socket.SOL_SOCKET, socket.SO_ERROR) == 0:
+                    return True
+                selector.unregister(key.fileobj)
+        return False
+    finally:
+        selector.close()
+        for sock in sockets:
+            sock.close()
+
+
+class ConnectivityMonitor:
+    """Keeps the online/offline state fresh from a background thread.
+
+    Probes run every fast_interval seconds after a state change and back off
+    towards slow_interval while the state stays the same. Subscribers are
+    called with the new state on every transition.
+    """
+    def __init__(self, hosts=PROBE_HOSTS, timeout=2, fast_interval=2, slow_interval=60):
+        self.hosts = hosts
+        self.timeout = timeout
+        self.fast_interval = fast_interval
+        self.slow_interval = slow_interval
+        self.interval = fast_interval
+        self.online = False
+        self.subscribers = []
+        self.first_probe = threading.Event()
+        self.probed = threading.Event()
+        self.wakeup = threading.Event()
+        self.stopped = False
+        self.thread = threading.Thread(target=self._run, name="isha-connectivity", daemon=True)
+
+    def start(self):
+        self.thread.start()
+        return self
+
+    def subscribe(self, callback):
+        """Call callback(online) whenever connectivity changes."""
+        self.subscribers.append(callback)
+
+    def refresh(self, wait=None):
+        """Ask the monitor to probe again right away.
+
+        With wait, block up to that many seconds for the probe and return
+        the resulting state.
+        """
+        self.probed.clear()
+        self.wakeup.set()
+        if wait:
+            self.probed.wait(wait)
+        return self.online
+
+    def is_online(self):
+        """Return the last known state, waiting once for the very first probe."""
+        if not self.first_probe.is_set():
+            self.first_probe.wait(self.timeout + 0.5)
+        return self.online
+
+    def stop(self):
+        self.stopped = True
+        self.wakeup.set()
+
+    def _run(self):
+        while not self.stopped:
+            online = probe_hosts(self.hosts, self.timeout)
+            changed = online != self.online
+            self.online = online
+            self.first_probe.set()
+            self.probed.set()
+            if changed:
+                self.interval = self.fast_interval
+                logging.info(f"Connectivity changed: {'online' if online else 'offline'}")
+                for callback in list(self.subscribers):
+                    try:
+                        callback(online)
+                    except Exception as e:
+                        logging.error(f"Connectivity subscriber failed: {str(e)}")
+            else:
+                self.interval = min(self.interval * 2, self.slow_interval)
+            self.wakeup.wait(self.interval)
+            self.wakeup.clear()
+
+
+class WeatherStore:
+    """Weather reports for several cities, persisted as JSON.
+
+    Entries younger than max_age are answered from the store. Entries older
+    than refresh_after are also refreshed in the background so the next
+    answer is current (stale-while-revalidate). The store keeps the most
+    recently asked max_entries cities.
+    """
+    def __init__(self, http, path=WEATHER_CACHE_PATH, max_entries=WEATHER_CACHE_SIZE,
+                 refresh_after=WEATHER_REFRESH_AFTER, max_age=WEATHER_MAX_AGE):
+        self.http = http
+        self.path = path
+        self.max_entries = max_entries
+        self.refresh_after = refresh_after
+        self.max_age = max_age
+        self.lock = threading.Lock()
+        self.refreshing = set()
+        self.entries = {}
+        try:
+            with open(path, "r") as f:
+                self.entries = json.load(f)
+        except (OSError, ValueError):
+            pass
+
+    @staticmethod
+    def key(city):
+        return " ".join(city.lower().split())
+
+    def lookup(self, city):
+        """Return (report, age in seconds) for a city, or (None, None)."""
+        with self.lock:
+            entry = self.entries.get(self.key(city))
+            if entry is None:
+                return None, None
+            entry["asked"] = time.time()
+            entry["asks"] = entry.get("asks", 1) + 1
+            return entry["report"], time.time() - entry["fetched"]
+
+    def fetch(self, city):
+        """Fetch a city's weather from wttr.in, store it and return the report."""
+        response = self.http.get(f"{WEATHER_URL}/{city}", params={"format": "3"})
+        report = response.text.strip()
+        now = time.time()
+        with self.lock:
+            entry = self.entries.setdefault(self.key(city), {"city": city, "asked": now, "asks": 1})
+            entry.update(report=report, fetched=now)
+            self._trim()
+            self._save()
+        return report
+
+    def refresh_in_background(self, city):
+        """Refetch a city on a background thread unless a refresh is running."""
+        key = self.key(city)
+        with self.lock:
+            if key in self.refreshing:
+                return
+            self.refreshing.add(key)
+
+        def worker():
+            try:
+                self.fetch(city)
+            except Exception as e:
+                logging.warning(f"Background weather refresh for {city} failed: {str(e)}")
+            finally:
+                with self.lock:
+                    self.refreshing.discard(key)
+
+        threading.Thread(target=worker, name="isha-weather", daemon=True).start()
+
+    def prefetch(self, limit=WEATHER_PREFETCH_CITIES):
+        """Refresh the most often and recently asked cities whose reports are getting old."""
+        now = time.time()
+        with self.lock:
+            recent = sorted(self.entries.values(), key=lambda entry: (entry.get("asks", 1), entry["asked"]),
+                            reverse=True)[:limit]
+            cities = [entry["city"] for entry in recent if now - entry["fetched"] > self.refresh_after]
+        for city in cities:
+            self.refresh_in_background(city)
+
+    def _trim(self):
+        if len(self.entries) > self.max_entries:
+            by_use = sorted(self.entries, key=lambda key: self.entries[key]["asked"], reverse=True)
+            for key in by_use[self.max_entries:]:
+                del self.entries[key]
+
+    def _save(self):
+        temp_path = f"{self.path}.tmp"
+        try:
+            with open(temp_path, "w") as f:
+                json.dump(self.entries, f)
+            os.replace(temp_path, self.path)
+        except OSError as e:
+            logging.error(f"Failed to save weather cache: {str(e)}")
+
+
+MATH_OPERATORS = {
+    ast.Add: operator.add, ast.Sub: operator.sub, ast.Mult: operator.mul, ast.Div: operator.truediv,
+    ast.FloorDiv: operator.floordiv, ast.Mod: operator.mod, ast.Pow: operator.pow,
+    ast.UAdd: operator.pos, ast.USub: operator.neg,
+}
+MATH_FUNCTIONS = {"sin": math.sin, "cos": math.cos, "tan": math.tan, "sqrt": math.sqrt}
+MATH_CONSTANTS = {"pi": math.pi}
+MAX_POWER_BITS = 100000
+
+
+class NotArithmetic(ValueError):
+    """Raised when an expression needs the symbolic (sympy) tier."""
+
+
+class ResultTooLarge(ValueError):
+    """Raised when an integer power would exceed MAX_POWER_BITS."""
+
+
+@functools.lru_cache(maxsize=256)
+def parse_arithmetic(expression):
+    """Parse and validate a plain arithmetic expression, caching the tree."""
+    try:
+        tree = ast.parse(expression.replace("^", "**"), mode="eval").body
+    except SyntaxError as e:
+        raise NotArithmetic(str(e))
+    # Function names are only valid as the callee of a call, never as values
+    callees = set()
+    for node in ast.walk(tree):
+        if isinstance(node, (ast.BinOp, ast.UnaryOp)):
+            if type(node.op) not in MATH_OPERATORS:
+                raise NotArithmetic(f"unsupported operator {type(node.op).__name__}")
+        elif isinstance(node, ast.Call):
+            if not isinstance(node.func, ast.Name) or node.func.id not in MATH_FUNCTIONS or node.keywords:
+                raise NotArithmetic("unsupported function call")
+            callees.add(id(node.func))
+        elif isinstance(node, ast.Name):
+            if id(node) not in callees and node.id not in MATH_CONSTANTS:
+                raise NotArithmetic(f"unknown name {node.id}")
+        elif isinstance(node, ast.Constant):
+            if type(node.value) not in (int, float):
+                raise NotArithmetic("unsupported constant")
+        elif not isinstance(node, (ast.operator, ast.unaryop, ast.Load)):
+            raise NotArithmetic(f"unsupported syntax {type(node).__name__}")
+    return tree
+
+
+def evaluate_arithmetic(node):
+    """Evaluate a tree returned by parse_arithmetic()."""
+    if isinstance(node, ast.Constant):
+        return node.value
+    if isinstance(node, ast.Name):
+        return MATH_CONSTANTS[node.id]
+    if isinstance(node, ast.UnaryOp):
+        return MATH_OPERATORS[type(node.op)](evaluate_arithmetic(node.operand))
+    if isinstance(node, ast.Call):
+        return MATH_FUNCTIONS[node.func.id](*[evaluate_arithmetic(arg) for arg in node.args])
+    left = evaluate_arithmetic(node.left)
+    right = evaluate_arithmetic(node.right)
+    if isinstance(node.op, ast.Pow) and isinstance(left, int) and isinstance(right, int):
+        if abs(left) > 1 and right > 0 and left.bit_length() * right > MAX_POWER_BITS:
+            raise ResultTooLarge("the result is too large")
+    return MATH_OPERATORS[type(node.op)](left, right)
+
+
+def format_number(value):
+    """Format a numeric result without trailing float noise."""
+    if isinstance(value, float) and value.is_integer() and abs(value) < 1e15:
+        return str(int(value))
+    if isinstance(value, float):
+        return f"{value:.15g}"
+    return str(value)
+
+
+def _sympy_worker(expression, memory_mb, conn):
+    """Child-process entry point: evaluate with sympy under a memory limit."""
+    try:
+        import resource
+        limit = memory_mb * 1024 * 1024
+        resource.setrlimit(resource.RLIMIT_AS, (limit, limit))
+    except (ImportError, ValueError, OSError):
+        pass
+    try:
+        sympy = importlib.import_module("sympy")
+        expr = sympy.sympify(expression, locals={"sin": sympy.sin, "cos": sympy.cos, "tan": sympy.tan,
+                                                 "sqrt": sympy.sqrt, "pi": sympy.pi})
+        conn.send((True, str(expr.evalf())))
+    except MemoryError:
+        conn.send((False, "the expression needs too much memory"))
+    except Exception as e:
+        conn.send((False, str(e)))
+    finally:
+        conn.close()
+
+
+class MathEngine:
+    """Two-tier calculator used by solve_math.
+
+    Plain arithmetic and the whitelisted functions are evaluated directly
+    from a cached syntax tree. Anything else goes to sympy in a forked
+    worker process that is killed after timeout seconds and limited to
+    memory_mb of address space.
+    """
+    def __init__(self, timeout=MATH_TIMEOUT, memory_mb=MATH_MEMORY_MB):
+        self.timeout = timeout
+        self.memory_mb = memory_mb
+
+    def solve(self, expression):
+        """Return (result text, tier name) or raise ValueError."""
+        expression = expression.strip().replace(" ", "")
+        try:
+            tree = parse_arithmetic(expression)
+        except NotArithmetic:
+            return self.solve_symbolic(expression), "sympy"
+        try:
+            value = evaluate_arithmetic(tree)
+        except (ZeroDivisionError, ResultTooLarge) as e:
+            raise ValueError(str(e))
+        except (ValueError, OverflowError):
+            # Domain errors and float overflow, e.g. sqrt(-4) or 10.0**400,
+            # have exact answers that sympy can give
+            return self.solve_symbolic(expression), "sympy"
+        except (ArithmeticError, TypeError) as e:
+            raise ValueError(str(e))
+        if isinstance(value, complex):
+            # e.g. (-8)**(1/3): Python picks the principal complex root
+            return self.solve_symbolic(expression), "sympy"
+        return format_number(value), "fast"
+
+    def solve_symbolic(self, expression):
+        """Evaluate with sympy in a worker process under time and memory limits."""
+        # Import in the parent first so the forked child does not pay for it.
+        lazy_import("sympy")
+        try:
+            context = multiprocessing.get_context("fork")
+        except ValueError:
+            context = multiprocessing.get_context()
+        parent_conn, child_conn = context.Pipe(duplex=False)
+        worker = context.Process(target=_sympy_worker, args=(expression, self.memory_mb, child_conn), daemon=True)
+        worker.start()
+        child_conn.close()
+        try:
+            if not parent_conn.poll(self.timeout):
+                raise ValueError(f"gave up after {self.timeout:g} seconds")
+            ok, result = parent_conn.recv()
+        except EOFError:
+            raise ValueError("the solver stopped unexpectedly")
+        finally:
+            parent_conn.close()
+            if worker.is_alive():
+                worker.kill()
+            worker.join()
+        if not ok:
+            raise ValueError(result)
+        return result
+
+
+def benchmark_math(expressions=None, repeat=2000):
+    """Time each math tier on sample expressions and print microseconds per call."""
+    expressions = expressions or ["2+2", "12*(3+4)/7", "2^10-1", "sqrt(2)*sin(pi/4)", "x**2+2*x+1"]
+    engine = MathEngine()
+    print(f"{'expression':<22} {'tier':<6} {'cold us':>10} {'warm us':>10}")
+    for expression in expressions:
+        parse_arithmetic.cache_clear()
+        start = time.perf_counter()
+        try:
+            _, tier = engine.solve(expression)
+        except Exception as e:
+            print(f"{expression:<22} {'-':<6} failed: {str(e)}")
+            continue
+        cold = (time.perf_counter() - start) * 1e6
+        runs = repeat if tier == "fast" else 3
+        start = time.perf_counter()
+        for _ in range(runs):
+            engine.solve(expression)
+        warm = (time.perf_counter() - start) * 1e6 / runs
+        print(f"{expression:<22} {tier:<6} {cold:10.1f} {warm:10.1f}")
+        if tier == "fast":
+            try:
+                sympy_warm = timed_average(lambda: engine.solve_symbolic(expression), 3)
+                print(f"{expression:<22} {'sympy':<6} {'':>10} {sympy_warm:10.1f}")
+            except Exception as e:
+                print(f"{expression:<22} {'sympy':<6} unavailable: {str(e)}")
+
+
+def percentile(sorted_values, pct):
+    """Return the pct-th percentile of an already sorted list (nearest rank)."""
+    rank = max(0, math.ceil(pct / 100 * len(sorted_values)) - 1)
+    return sorted_values[rank]
+
+
+def timed_average(func, runs):
+    """Return the mean wall time of func() in microseconds."""
+    start = time.perf_counter()
+    for _ in range(runs):
+        func()
+    return (time.perf_counter() - start) * 1e6 / runs
+
+
+class VoiceCapture:
+    """Runs speech recognition and typed input side by side.
+
+    get() returns whichever arrives first: a line typed on the terminal or
+    the recognizer's transcript. arm() starts the recognizer ahead of time
+    so that it is already listening when the next prompt comes up. The
+    recognizer is only started once wait_quiet() returns, so it does not
+    transcribe the assistant's own speech. The voice timeout follows recent
+    recognition times instead of a fixed 10s.
+    """
+    def __init__(self, command=STT_COMMAND, default_timeout=10, min_timeout=4, max_timeout=15, wait_quiet=None):
+        self.command = command
+        self.wait_quiet = wait_quiet
+        self.default_timeout = default_timeout
+        self.min_timeout = min_timeout
+        self.max_timeout = max_timeout
+        self.durations = collections.deque(maxlen=8)
+        self.results = queue.Queue()
+        self.lock = threading.Lock()
+        self.generation = 0
+        self.process = None
+        self.arming = False
+        self.started = None
+        self.available = True
+        self.stdin_thread = None
+
+    def timeout(self):
+        """Seconds to wait for speech, based on how long recent recognitions took."""
+        if not self.durations:
+            return self.default_timeout
+        return min(self.max_timeout, max(self.min_timeout, max(self.durations) * 1.5 + 1))
+
+    def arm(self):
+        """Start a recognition in the background, once speech output is quiet, unless one is already running."""
+        with self.lock:
+            if self.process is not None or self.arming or not self.available:
+                return
+            self.arming = True
+            self.started = None
+            generation = self.generation
+        threading.Thread(target=self._listen, args=(generation,), name="isha-voice", daemon=True).start()
+
+    def cancel(self):
+        """Stop the running recognition and ignore whatever it returns."""
+        with self.lock:
+            self.generation += 1
+            process = self.process
+            self.process = None
+            self.started = None
+        if process is not None and process.poll() is None:
+            process.terminate()
+
+    def get(self, prompt="Input: "):
+        """Wait for typed or spoken input; None means the terminal was closed."""
+        self.arm()
+        if self.stdin_thread is None:
+            self.stdin_thread = threading.Thread(target=self._read_stdin, name="isha-stdin", daemon=True)
+            self.stdin_thread.start()
+        sys.stdout.write(prompt)
+        sys.stdout.flush()
+        waiting_for_voice = self.available
+        voice_deadline = None
+        while True:
+            if waiting_for_voice and voice_deadline is None and self.started is not None:
+                # The timeout runs from when the recognizer started, not from
+                # the prompt, since it may first wait for speech to finish
+                voice_deadline = self.started + self.timeout()
+            if voice_deadline is not None:
+                wait = max(0.0, voice_deadline - time.monotonic())
+            else:
+                wait = 0.1 if waiting_for_voice and self.available else None
+            try:
+                source, generation, text = self.results.get(timeout=wait)
+            except queue.Empty:
+                if voice_deadline is None:
+                    continue
+                source, generation, text = "voice", self.generation, ""
+                self.cancel()
+            if source == "typed":
+                self.cancel()
+                return None if text is None else text.lower().strip()
+            if generation != self.generation and text:
+                continue
+            if text:
+                print(text)
+                return text
+            if waiting_for_voice:
+                waiting_for_voice = False
+                voice_deadline = None
+                print("\nVoice input failed or not detected. Please type your command.")
+                sys.stdout.write(prompt)
+                sys.stdout.flush()
+
+    def _listen(self, generation):
+        if self.wait_quiet is not None:
+            self.wait_quiet()
+        with self.lock:
+            self.arming = False
+            if generation != self.generation or self.process is not None:
+                return
+            try:
+                process = subprocess.Popen([self.command], stdout=subprocess.PIPE,
+                                           stderr=subprocess.DEVNULL, text=True)
+            except OSError as e:
+                logging.error(f"Voice input unavailable: {str(e)}")
+                self.available = False
+                self.results.put(("voice", generation, ""))
+                return
+            self.process = process
+            self.started = time.monotonic()
+        self._wait_for_speech(process, generation)
+
+    def _wait_for_speech(self, process, generation):
+        start = time.perf_counter()
+        output, _ = process.communicate()
+        elapsed = time.perf_counter() - start
+        with self.lock:
+            if self.process is process:
+                self.process = None
+            current = generation == self.generation
+        text = (output or "").strip().lower()
+        if process.returncode == 0 and text:
+            self.durations.append(elapsed)
+            METRICS.observe("listen", elapsed)
+        if current:
+            self.results.put(("voice", generation, text))
+
+    def _read_stdin(self):
+        while True:
+            line = sys.stdin.readline()
+            self.results.put(("typed", None, line or None))
+            if not line:
+                return
+
+
+def media_tokens(text):
+    """Split a file name or query into lower-case search tokens."""
+    return [token for token in re.split(r"[^0-9a-z]+", text.lower()) if token]
+
+
+class MediaLibrary:
+    """A persistent index of local music and video files.
+
+    The index remembers every directory's mtime and direct entries, so a
+    refresh only rescans directories whose mtime changed; unchanged ones
+    cost a single stat. File names are tokenized into an inverted index
+    for search, and shuffle() hands out every file once before repeating.
+    Both bring the index up to date first (at most every min_interval
+    seconds), so a long-running daemon sees newly added files.
+    """
+    def __init__(self, path=MEDIA_INDEX_PATH, roots=None, min_interval=2):
+        self.path = path
+        self.min_interval = min_interval
+        self.checked = None
+        self.roots = roots or {"music": MUSIC_DIRS, "video": VIDEO_DIRS}
+        self.lock = threading.Lock()
+        # directory -> {"mtime": float, "files": [names], "dirs": [names]}
+        self.directories = {}
+        self.files = {"music": [], "video": []}
+        self.tokens = {"music": {}, "video": {}}
+        self.shuffle_queues = {"music": [], "video": []}
+        try:
+            with open(path, "r") as f:
+                self.directories = json.load(f)
+        except (OSError, ValueError):
+            pass
+        self._rebuild()
+
+    def refresh(self):
+        """Bring the index up to date with the filesystem; returns True if anything changed."""
+        changed = False
+        with self.lock:
+            self.checked = time.monotonic()
+            seen = set()
+            visited = set()
+            for kind, roots in self.roots.items():
+                for root in roots:
+                    changed |= self._scan(root, seen, visited)
+            for directory in list(self.directories):
+                if directory not in seen:
+                    del self.directories[directory]
+                    changed = True
+            if changed:
+                self._rebuild()
+                self._save()
+        return changed
+
+    def refresh_if_due(self):
+        """Refresh unless that was done in the last min_interval seconds."""
+        if self.checked is not None and time.monotonic() - self.checked < self.min_interval:
+            return
+        try:
+            with METRICS.span("media index refresh"):
+                self.refresh()
+        except Exception as e:
+            logging.error(f"Media index refresh failed: {str(e)}")
+
+    def refresh_in_background(self):
+        def worker():
+            try:
+                with METRICS.span("media index refresh"):
+                    self.refresh()
+            except Exception as e:
+                logging.error(f"Media index refresh failed: {str(e)}")
+
+        thread = threading.Thread(target=worker, name="isha-media-index", daemon=True)
+        thread.start()
+        return thread
+
+    def search(self, kind, query):
+        """Return files of a kind matching every token of the query, best first."""
+        words = media_tokens(query)
+        if not words:
+            return []
+        self.refresh_if_due()
+        with self.lock:
+            index = self.tokens[kind]
+            matches = None
+            for word in words:
+                postings = index.get(word)
+                if postings is None:
+                    matches = None
+                    break
+                matches = set(postings) if matches is None else matches & postings
+            if not matches:
+                # Fall back to substring matching so partial words still work
+                matches = {path for path in self.files[kind]
+                           if all(word in os.path.basename(path).lower() for word in words)}
+        return sorted(matches, key=lambda path: (len(os.path.basename(path)), path))
+
+    def shuffle(self, kind):
+        """Return a random file of a kind without repeating until all were played."""
+        self.refresh_if_due()
+        with self.lock:
+            pending = self.shuffle_queues[kind]
+            if not pending:
+                pending.extend(self.files[kind])
+                random.shuffle(pending)
+            return pending.pop() if pending else None
+
+    def _scan(self, directory, seen, visited):
+        try:
+            stat = os.stat(directory)
+        except OSError:
+            return False
+        # Symlinks are followed (Termux's ~/storage is made of them), but each
+        # real directory is indexed once so a link to a parent cannot loop.
+        if (stat.st_dev, stat.st_ino) in visited:
+            return False
+        visited.add((stat.st_dev, stat.st_ino))
+        mtime = stat.st_mtime
+        seen.add(directory)
+        entry = self.directories.get(directory)
+        changed = False
+        if entry is None or entry["mtime"] != mtime:
+            files, dirs = [], []
+            try:
+                with os.scandir(directory) as iterator:
+                    for item in iterator:
+                        try:
+                            if item.is_dir():
+                                dirs.append(item.name)
+                            elif item.is_file():
+                                files.append(item.name)
+                        except OSError:
+                            continue
+            except OSError:
+                return False
+            entry = {"mtime": mtime, "files": files, "dirs": dirs}
+            self.directories[directory] = entry
+            changed = True
+        for name in entry["dirs"]:
+            changed |= self._scan(os.path.join(directory, name), seen, visited)
+        return changed
+
+    def _rebuild(self):
+        for kind, roots in self.roots.items():
+            extensions = MEDIA_EXTENSIONS[kind]
+            files = []
+            for directory, entry in self.directories.items():
+                if not any(directory == root or directory.startswith(root.rstrip(os.sep) + os.sep) for root in roots):
+                    continue
+                files.extend(os.path.join(directory, name) for name in entry["files"]
+                             if os.path.splitext(name)[1].lower() in extensions)
+            index = {}
+            for path in files:
+                for token in media_tokens(os.path.splitext(os.path.basename(path))[0]):
+                    index.setdefault(token, set()).add(path)
+            self.files[kind] = files
+            self.tokens[kind] = index
+            known = set(files)
+            self.shuffle_queues[kind] = [path for path in self.shuffle_queues[kind] if path in known]
+
+    def _save(self):
+        temp_path = f"{self.path}.tmp"
+        try:
+            with open(temp_path, "w") as f:
+                json.dump(self.directories, f)
+            os.replace(temp_path, self.path)
+        except OSError as e:
+            logging.error(f"Failed to save media index: {str(e)}")
+
+
+class Job:
+    """A background action tracked by the JobQueue."""
+    def __init__(self, job_id, description, owner=None):
+        self.id = job_id
+        self.description = description
+        self.owner = owner
+        self.status = "queued"
+        self.result = None
+        self.error = None
+        self.submitted = time.time()
+        self.finished = None
+
+
+class JobQueue:
+    """Runs side-effecting actions on a small worker pool.
+
+    Each job gets an id and a status that the "jobs" command can show.
+    Exceptions stay inside the job and are reported through
+    notify(text, owner) instead of reaching the command loop, where owner
+    is what owner() returned when the job was submitted (the daemon client
+    that asked for it). At most max_pending jobs can be queued or running
+    at once.
+    """
+    def __init__(self, notify, workers=JOB_WORKERS, max_pending=JOB_LIMIT, history=20, owner=None):
+        self.notify = notify
+        self.owner = owner
+        self.max_pending = max_pending
+        self.history = history
+        self.executor = concurrent.futures.ThreadPoolExecutor(max_workers=workers, thread_name_prefix="isha-job")
+        self.jobs = collections.OrderedDict()
+        self.ids = itertools.count(1)
+        self.lock = threading.Lock()
+
+    def submit(self, description, func, *args, success_message=None, announce_failure=True):
+        """Queue func(*args); returns the Job, or None if the queue is full.
+
+        success_message, if given, is announced when the job finishes;
+        failures are announced unless announce_failure is false.
+        """
+        with self.lock:
+            if len(self.active()) >= self.max_pending:
+                return None
+            job = Job(next(self.ids), description, self.owner() if self.owner else None)
+            self.jobs[job.id] = job
+            while len(self.jobs) > self.history and next(iter(self.jobs.values())).status in ("done", "failed"):
+                self.jobs.popitem(last=False)
+        self.executor.submit(self._run, job, func, args, success_message, announce_failure)
+        return job
+
+    def active(self):
+        return [job for job in self.jobs.values() if job.status in ("queued", "running")]
+
+    def wait(self, timeout=None):
+        """Wait for queued and running jobs; returns False if some are still active."""
+        deadline = None if timeout is None else time.monotonic() + timeout
+        while self.active():
+            if deadline is not None and time.monotonic() >= deadline:
+                return False
+            time.sleep(0.05)
+        return True
+
+    def shutdown(self, timeout=30):
+        if self.active():
+            self.notify(f"Waiting for {len(self.active())} background job(s) to finish")
+            self.wait(timeout)
+        self.executor.shutdown(wait=False, cancel_futures=True)
+
+    def _run(self, job, func, args, success_message, announce_failure):
+        job.status = "running"
+        start = time.perf_counter()
+        try:
+            job.result = func(*args)
+            job.status = "done"
+        except Exception as e:
+            job.status = "failed"
+            job.error = str(e)
+            logging.error(f"Job {job.id} ({job.description}) failed: {str(e)}")
+        finally:
+            job.finished = time.time()
+            METRICS.observe("job", time.perf_counter() - start)
+        try:
+            if job.status == "failed" and announce_failure:
+                self.notify(f"Job {job.id} failed: {job.description}", job.owner)
+            elif success_message:
+                self.notify(success_message, job.owner)
+        except Exception as e:
+            logging.error(f"Job notification failed: {str(e)}")
+
+
+class OutputCapture:
+    """A sys.stdout wrapper that lets each thread capture its own prints.
+
+    Unlike contextlib.redirect_stdout this is safe when several commands run
+    at once (daemon mode): prints from a capturing thread go to its buffer,
+    everything else goes to the real stream.
+    """
+    def __init__(self, stream):
+        self.stream = stream
+        self.local = threading.local()
+
+    def write(self, text):
+        buffer = getattr(self.local, "buffer", None)
+        return (buffer if buffer is not None else self.stream).write(text)
+
+    def flush(self):
+        if getattr(self.local, "buffer", None) is None:
+            self.stream.flush()
+
+    def __getattr__(self, name):
+        return getattr(self.stream, name)
+
+    @contextlib.contextmanager
+    def capture(self):
+        buffer = io.StringIO()
+        self.local.buffer = buffer
+        try:
+            yield buffer
+        finally:
+            self.local.buffer = None
+
+
+def output_capture():
+    """Install (once) and return the thread-aware stdout wrapper."""
+    if not isinstance(sys.stdout, OutputCapture):
+        sys.stdout = OutputCapture(sys.stdout)
+    return sys.stdout
+
+
+class DaemonRunning(RuntimeError):
+    """Raised when another daemon is already serving the socket."""
+
+
+class AssistantServer(socketserver.ThreadingMixIn, socketserver.UnixStreamServer):
+    """Serves commands to local clients over a Unix domain socket.
+
+    Each request is one line: a JSON object such as
+    {"command": "weather", "inputs": ["london"]} or just the command text.
+    Each response is one JSON line with the command's output and timing.
+    """
+    daemon_threads = True
+    request_queue_size = 64
+
+    def __init__(self, assistant, path=SOCKET_PATH):
+        self.assistant = assistant
+        self.path = path
+        if os.path.exists(path):
+            try:
+                with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as probe:
+                    probe.connect(path)
+                raise DaemonRunning(f"Isha Assistant is already running on {path}")
+            except (ConnectionRefusedError, FileNotFoundError):
+                os.unlink(path)
+        super().__init__(path, AssistantRequestHandler)
+        os.chmod(path, 0o600)
+
+    def server_close(self):
+        super().server_close()
+        try:
+            os.unlink(self.path)
+        except OSError:
+            pass
+
+
+class AssistantRequestHandler(socketserver.StreamRequestHandler):
+    """Handles one client connection; a client may send several requests."""
+    def handle(self):
+        for raw in self.rfile:
+            line = raw.decode("utf-8", errors="replace").strip()
+            if not line:
+                continue
+            try:
+                request = json.loads(line) if line.startswith("{") else {"command": line}
+            except ValueError as e:
+                response = {"ok": False, "error": f"Invalid request: {str(e)}"}
+            else:
+                if request.get("shutdown"):
+                    self._reply({"ok": True, "output": ["Output: Stopping Isha Assistant daemon"]})
+                    threading.Thread(target=self.server.shutdown, daemon=True).start()
+                    return
+                assistant = self.server.assistant
+                assistant.input_lines = iter(request.get("inputs") or [])
+                assistant.local.client = request.get("client")
+                record, _ = assistant.execute(str(request.get("command", "")))
+                assistant.input_lines = None
+                assistant.local.client = None
+                response = dict(record, ok=record["error"] is None)
+            self._reply(response)
+
+    def _reply(self, response):
+        self.wfile.write((json.dumps(response) + "\n").encode("utf-8"))
+        self.wfile.flush()
+
+
+def send_command(command, inputs=(), path=SOCKET_PATH, timeout=120, shutdown=False, client=None):
+    """Send one request to a running daemon and return its JSON response.
+
+    client names who is asking, so results of background jobs come back to
+    the same caller; it defaults to the calling shell's process id.
+    """
+    if shutdown:
+        request = {"shutdown": True}
+    else:
+        request = {"command": command, "inputs": list(inputs), "client": client or f"shell-{os.getppid()}"}
+    with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as sock:
+        sock.settimeout(timeout)
+        sock.connect(path)
+        sock.sendall((json.dumps(request) + "\n").encode("utf-8"))
+        with sock.makefile("rb") as reader:
+            line = reader.readline()
+    if not line:
+        raise ConnectionError("The daemon closed the connection without answering")
+    return json.loads(line)
+
+
+class HistoryStore:
+    """Bounded command history with an append-only file behind it.
+
+    The last size commands live in a ring (deque). Each command is appended
+    to a tab-separated file as "timestamp<TAB>handler<TAB>command". Once the
+    file has twice as many lines as the ring, it is rewritten with just the
+    ring, so appends stay O(1) amortized and startup reads at most 2 * size
+    lines. Per-command and per-handler counts are kept for the current ring,
+    with a sorted list of distinct commands for prefix search.
+    """
+    def __init__(self, path=HISTORY_PATH, size=HISTORY_SIZE):
+        self.path = path
+        self.entries = collections.deque(maxlen=size)
+        self.command_counts = collections.Counter()
+        self.handler_counts = collections.Counter()
+        self.sorted_commands = []
+        self.lines_on_disk = 0
+        self.lock = threading.Lock()
+        self.file = None
+        try:
+            with open(path, "r", encoding="utf-8") as f:
+                for line in f:
+                    parts = line.rstrip("\n").split("\t", 2)
+                    if len(parts) == 3 and parts[0].isdigit():
+                        self._add((int(parts[0]), parts[1], parts[2]))
+                        self.lines_on_disk += 1
+        except OSError:
+            pass
+
+    def append(self, command, handler):
+        """Record a command and the handler that ran it."""
+        command = " ".join(command.split())
+        if not command:
+            return
+        entry = (int(time.time()), handler, command)
+        with self.lock:
+            self._add(entry)
+            try:
+                if self.file is None:
+                    self.file = open(self.path, "a", encoding="utf-8")
+                self.file.write(f"{entry[0]}\t{handler}\t{command}\n")
+                self.file.flush()
+                self.lines_on_disk += 1
+                if self.lines_on_disk > 2 * self.entries.maxlen:
+                    self._compact()
+            except OSError as e:
+                logging.error(f"Failed to write command history: {str(e)}")
+
+    def recent(self, count=10):
+        """Return up to count commands, newest first."""
+        with self.lock:
+            return [entry[2] for entry in itertools.islice(reversed(self.entries), count)]
+
+    def get(self, position=1):
+        """Return the position-th most recent command (1 is the last one), or None."""
+        with self.lock:
+            if 0 < position <= len(self.entries):
+                return self.entries[-position][2]
+        return None
+
+    def search(self, prefix, limit=10):
+        """Return distinct commands starting with prefix, most used first."""
+        with self.lock:
+            start = bisect.bisect_left(self.sorted_commands, prefix)
+            end = bisect.bisect_left(self.sorted_commands, prefix + "\uffff")
+            matches = self.sorted_commands[start:end]
+            return sorted(matches, key=lambda command: -self.command_counts[command])[:limit]
+
+    def frequent(self, handler=None, limit=5):
+        """Return (command, count) pairs for the most used commands, optionally of one handler."""
+        with self.lock:
+            if handler is None:
+                return self.command_counts.most_common(limit)
+            handled = {entry[2] for entry in self.entries if entry[1] == handler}
+            return [(command, count) for command, count in self.command_counts.most_common()
+                    if command in handled][:limit]
+
+    def handler_shares(self):
+        """Return each handler's share of the commands in the ring."""
+        with self.lock:
+            total = len(self.entries)
+            return {handler: count / total for handler, count in self.handler_counts.items()} if total else {}
+
+    def close(self):
+        with self.lock:
+            if self.file is not None:
+                self.file.close()
+                self.file = None
+
+    def _add(self, entry):
+        if len(self.entries) == self.entries.maxlen:
+            _, old_handler, old_command = self.entries[0]
+            self.handler_counts[old_handler] -= 1
+            if self.handler_counts[old_handler] <= 0:
+                del self.handler_counts[old_handler]
+            self.command_counts[old_command] -= 1
+            if self.command_counts[old_command] <= 0:
+                del self.command_counts[old_command]
+                index = bisect.bisect_left(self.sorted_commands, old_command)
+                del self.sorted_commands[index]
+        self.entries.append(entry)
+        _, handler, command = entry
+        self.handler_counts[handler] += 1
+        if self.command_counts[command] == 0:
+            bisect.insort(self.sorted_commands, command)
+        self.command_counts[command] += 1
+
+    def _compact(self):
+        if self.file is not None:
+            self.file.close()
+            self.file = None
+        temp_path = f"{self.path}.tmp"
+        with open(temp_path, "w", encoding="utf-8") as f:
+            for timestamp, handler, command in self.entries:
+                f.write(f"{timestamp}\t{handler}\t{command}\n")
+        os.replace(temp_path, self.path)
+        self.lines_on_disk = len(self.entries)
+
+
+class AsyncCore:
+    """Runs the assistant on an asyncio event loop.
+
+    Input is read on its own thread while commands run as tasks, so a fast
+    command like "time" is answered while a slow Gemini query is still in
+    flight. Coroutine handlers (async def) run on the loop; synchronous
+    handlers are adapted by running process_command on a worker pool. Each
+    command gets a timeout, and "cancel" (or "cancel <n>") stops commands
+    that are still running. Handlers marked interactive ask follow-up
+    questions, so the next command is read only after they finish.
+
+    A thread cannot be stopped, so a synchronous handler that times out or
+    is cancelled keeps running; its cancel event is set so that slow
+    handlers (Gemini, weather) drop their result instead of printing,
+    speaking or caching it. Up to max_abandoned such threads give their
+    slot back straight away and run on spare pool workers; beyond that a
+    stuck command holds its slot until its thread really finishes.
+    """
+    def __init__(self, assistant, timeout=COMMAND_TIMEOUT, max_in_flight=MAX_IN_FLIGHT, max_abandoned=None):
+        self.assistant = assistant
+        self.timeout = timeout
+        self.max_in_flight = max_in_flight
+        self.max_abandoned = max_in_flight if max_abandoned is None else max_abandoned
+        self.tasks = {}
+        self.work = {}
+        self.abandoned = set()
+        self.ids = itertools.count(1)
+        self.executor = concurrent.futures.ThreadPoolExecutor(max_workers=max_in_flight + self.max_abandoned,
+                                                              thread_name_prefix="isha-command")
+        self.input_executor = concurrent.futures.ThreadPoolExecutor(max_workers=1, thread_name_prefix="isha-input")
+
+    async def run(self):
+        asyncio = lazy_import("asyncio")
+        loop = asyncio.get_running_loop()
+        slots = asyncio.Semaphore(self.max_in_flight)
+        try:
+            while True:
+                command = await loop.run_in_executor(self.input_executor, self.assistant.listen)
+                if command == "cancel" or command.startswith("cancel "):
+                    self.cancel(command[7:].strip())
+                    continue
+                handler, args = COMMANDS.resolve(command)
+                if handler is IshaAssistant.repeat_command:
+                    # Expand the repeat here, so a repeated interactive command
+                    # still holds the input loop for its follow-up questions.
+                    previous = self.assistant.repeated_command(*args)
+                    if previous is not None:
+                        print(f"Output: Repeating {previous}")
+                        command = previous
+                        handler, _ = COMMANDS.resolve(command)
+                if handler is IshaAssistant.exit_assistant:
+                    await self.drain()
+                    await self.execute(command)
+                    break
+                await slots.acquire()
+                task_id = next(self.ids)
+                task = asyncio.create_task(self.dispatch(task_id, command, slots))
+                self.tasks[task_id] = (command, task)
+                if COMMANDS.is_interactive(handler):
+                    await asyncio.wait({task})
+        finally:
+            self.executor.shutdown(wait=False, cancel_futures=True)
+            self.input_executor.shutdown(wait=False, cancel_futures=True)
+
+    async def dispatch(self, task_id, command, slots):
+        """Run one command with a timeout, reporting cancellation and errors."""
+        asyncio = lazy_import("asyncio")
+        try:
+            await asyncio.wait_for(self.execute(command, task_id), self.timeout)
+        except asyncio.TimeoutError:
+            METRICS.incr("timeouts")
+            print(f"Output: {command!r} timed out after {self.timeout:g} seconds")
+            self.assistant.speak("That took too long, I stopped waiting")
+        except asyncio.CancelledError:
+            print(f"Output: Cancelled {command!r}")
+        except Exception as e:
+            logging.exception(f"Command failed: {command}")
+            print(f"Output: {command!r} failed: {str(e)}")
+        finally:
+            self.tasks.pop(task_id, None)
+            work, cancel_event = self.work.pop(task_id, (None, None))
+            if work is None or work.done():
+                slots.release()
+            else:
+                # The thread cannot be stopped, but it will drop its result
+                cancel_event.set()
+                self.abandon(command, work, slots)
+
+    def abandon(self, command, work, slots):
+        """Stop waiting for a pool thread that is still running a command."""
+        loop = lazy_import("asyncio").get_running_loop()
+
+        def on_loop(callback, *args):
+            # The thread may outlive the loop when the assistant exits
+            if not loop.is_closed():
+                loop.call_soon_threadsafe(callback, *args)
+
+        METRICS.incr("abandoned")
+        if len(self.abandoned) < self.max_abandoned:
+            logging.warning(f"Abandoned a worker thread still running {command!r}")
+            self.abandoned.add(work)
+            work.add_done_callback(lambda _: on_loop(self.abandoned.discard, work))
+            slots.release()
+        else:
+            logging.warning(f"Too many abandoned threads; {command!r} keeps its slot until it finishes")
+            work.add_done_callback(lambda _: on_loop(slots.release))
+
+    async def execute(self, command, task_id=None):
+        """Await a coroutine handler directly, or run a synchronous one on the pool."""
+        handler, args = COMMANDS.resolve(command)
+        if not inspect.iscoroutinefunction(handler):
+            cancel_event = threading.Event()
+            work = self.executor.submit(self.assistant.process_command, command, cancel_event)
+            if task_id is not None:
+                self.work[task_id] = (work, cancel_event)
+            return await lazy_import("asyncio").wrap_future(work)
+        logging.info(f"Processing command: {command}, Internet: {self.assistant.connectivity.online}")
+        print(f"Input: {command}")
+        self.assistant.speech.interrupt()
+        start = time.perf_counter()
+        try:
+            return await handler(self.assistant, *args) is not False
+        finally:
+            METRICS.incr("commands")
+            METRICS.observe("command", time.perf_counter() - start)
+            METRICS.observe(f"handler.{handler.__name__}", time.perf_counter() - start)
+
+    def cancel(self, which=""):
+        """Cancel one running command by number, or all of them."""
+        targets = [(task_id, entry) for task_id, entry in self.tasks.items() if not which or str(task_id) == which]
+        if not targets:
+            print("Output: Nothing to cancel")
+            self.assistant.speak("Nothing to cancel")
+            return
+        for task_id, (command, task) in targets:
+            print(f"Output: Cancelling {task_id}: {command}")
+            task.cancel()
+
+    async def drain(self, timeout=None):
+        """Wait for commands still in flight before exiting."""
+        pending = [task for _, task in self.tasks.values()]
+        if pending:
+            await lazy_import("asyncio").wait(pending, timeout=self.timeout if timeout is None else timeout)
 
-# Load environment variables
-load_dotenv()
 
 class IshaAssistant:
     """A personal desktop assistant for Termux with text-based command capabilities."""
-    def __init__(self):
+    def __init__(self, startup_report=False, prewarm=False, text_only=False, stream=False, voice=True,
+                 use_async=False):
+        self.startup_report = startup_report
+        self.use_async = use_async
+        self.prewarm = prewarm
+        self.stream = stream
+        self.voice = voice
+        self.voice_capture = None
+        self.prearm = VOICE_PREARM
+        # Batch and daemon mode: stdout is JSON, so notifications are queued
+        # per client and handed back with that client's next command
+        self.headless = False
+        self.notifications = collections.OrderedDict()
+        self.notifications_lock = threading.Lock()
+        # Per-thread state: scripted input for batch and daemon requests
+        self.local = threading.local()
+
         # Initialize logging
-        logging.basicConfig(filename="isha_assistant.log", level=logging.INFO, 
-                           format="%(asctime)s - %(levelname)s - %(message)s")
-        
-        # Internet check caching
-        self.last_internet_check = 0
-        self.internet_status = False
-        self.internet_check_interval = 10
-        
-        # Check for Gemini API key
+        with STARTUP_TIMER.phase("logging setup"):
+            setup_logging()
+
+        self.speech = SpeechWorker(enabled=voice and not text_only)
+        # A failed request re-probes at once instead of waiting up to a minute
+        self.http = HttpClient(check_online=lambda: self.connectivity.refresh(wait=self.connectivity.timeout + 0.5))
+        self.math = MathEngine()
+        self.jobs = JobQueue(self.notify, owner=lambda: getattr(self.local, "client", None))
+        with STARTUP_TIMER.phase("open response cache"):
+            self.response_cache = ResponseCache()
+        with STARTUP_TIMER.phase("load weather store"):
+            self.weather = WeatherStore(self.http)
+        with STARTUP_TIMER.phase("load history"):
+            self.history = HistoryStore()
+        COMMANDS.usage = self.history.handler_shares
+        with STARTUP_TIMER.phase("load media index"):
+            self.media = MediaLibrary()
+        self.media.refresh_in_background()
+
+        # Connectivity is probed in the background; check_internet() only reads it
+        self.connectivity = ConnectivityMonitor()
+        self.connectivity.subscribe(lambda online: online and self.warm_caches())
+        self.connectivity.start()
+
+        # Load environment variables
+        with STARTUP_TIMER.phase("load .env"):
+            load_env()
+
+    @property
+    def input_lines(self):
+        """When set (batch and daemon mode), listen() reads from this iterator instead of the terminal."""
+        return getattr(self.local, "input_lines", None)
+
+    @input_lines.setter
+    def input_lines(self, lines):
+        self.local.input_lines = lines
+
+    def check_api_key(self, interactive=True):
+        """Make sure a Gemini API key is set, asking for one if interactive."""
         api_key = os.getenv("GEMINI_API_KEY")
-        if not api_key:
+        if not api_key and interactive:
             api_key = input("Enter your Gemini API key (get one from https://aistudio.google.com/app/apikey): ")
             if api_key:
                 os.environ["GEMINI_API_KEY"] = api_key
-            else:
-                print("Output: Gemini API key not provided. AI queries may not work.")
-                self.speak("Gemini API key not provided. AI queries may not work.")
-        
-        self.wish_me()
-        self.run()
+        if not api_key and not interactive:
+            # Batch and daemon stdout carry JSON, so warn on stderr instead
+            logging.warning("Gemini API key not provided")
+            print("Output: Gemini API key not provided. AI queries may not work.", file=sys.stderr)
+        elif not api_key:
+            print("Output: Gemini API key not provided. AI queries may not work.")
+            self.speak("Gemini API key not provided. AI queries may not work.")
+
+    def start(self):
+        """Check the API key, greet the user and enter the interactive loop."""
+        self.check_api_key()
+        with STARTUP_TIMER.phase("greeting"):
+            self.wish_me()
+        if self.use_async:
+            self.run_async()
+        else:
+            self.run()
 
     def check_internet(self):
-        """Check internet connectivity with caching."""
-        current_time = time.time()
-        if current_time - self.last_internet_check < self.internet_check_interval:
-            return self.internet_status
+        """Return the connectivity state kept fresh by the background monitor."""
+        with METRICS.span("connectivity"):
+            return self.connectivity.is_online()
 
-        self.last_internet_check = current_time
-        for host in [("8.8.8.8", 80), ("1.1.1.1", 80)]:
-            try:
-                socket.create_connection(host, timeout=2)
-                self.internet_status = True
-                return True
-            except (socket.gaierror, socket.timeout):
-                continue
-        self.internet_status = False
-        return False
+    def speak(self, text, continues=False):
+        """Queue the given text for Termux TTS without waiting for it."""
+        with METRICS.span("speech"):
+            self.speech.say(text, continues)
+
+    def notify(self, text, client=None):
+        """Announce a background event such as a finished job.
 
-    def speak(self, text):
-        """Speak the given text using Termux TTS."""
+        In batch and daemon mode stdout carries JSON, so the event goes to
+        stderr instead and is attached to the next record of the client
+        whose command started it.
+        """
+        logging.info(f"Notification: {text}")
+        if self.headless:
+            print(f"Output: {text}", file=sys.stderr)
+            if client is not None:
+                with self.notifications_lock:
+                    self.notifications.setdefault(client, collections.deque(maxlen=50)).append(text)
+                    self.notifications.move_to_end(client)
+                    while len(self.notifications) > 32:
+                        self.notifications.popitem(last=False)
+            return
+        print(f"Output: {text}")
+        self.speak(text)
+
+    def open_url(self, url, description, message):
+        """Open a URL with termux-open-url and announce message once it has opened.
+
+        Interactively the launch runs as a background job so the prompt comes
+        back at once. In batch and daemon mode it runs within the command, so
+        a failed launch is reported in that command's record.
+        """
+        if self.headless:
+            self.run_subprocess(["termux-open-url", url])
+            print(f"Output: {message}")
+            self.speak(message)
+            return None
+        job = self.jobs.submit(description, self.run_subprocess, ["termux-open-url", url], success_message=message)
+        if job is None:
+            print("Output: Too many background jobs are running. Please try again shortly.")
+        return job
+
+    def open_local(self, path, description):
+        """Open a local file or folder with termux-open; returns False if it failed."""
         try:
-            subprocess.run(["termux-tts-speak", text], check=True)
-        except subprocess.CalledProcessError as e:
-            print(f"Output: Speech error: {str(e)}")
-            logging.error(f"Speech error: {str(e)}")
+            self.run_subprocess(["termux-open", path])
+            return True
+        except (OSError, subprocess.CalledProcessError) as e:
+            print(f"Output: Failed to {description}: {str(e)}")
+            self.speak(f"Failed to {description}")
+            return False
+
+    def run_subprocess(self, args, **kwargs):
+        """Run a Termux helper command, timing it as a subprocess span."""
+        with METRICS.span("subprocess"):
+            return subprocess.run(args, check=True, **kwargs)
 
+    @COMMANDS.phrase("greet me")
     def wish_me(self):
         """Greet the user based on the time of day."""
         current_hour = datetime.datetime.now().hour
@@ -82,19 +2254,34 @@ class IshaAssistant:
 
     def listen(self):
         """Get input from the user (text or voice)."""
+        if self.input_lines is not None:
+            return next(self.input_lines, "").lower().strip()
+        if self.voice:
+            if self.voice_capture is None:
+                self.voice_capture = VoiceCapture(wait_quiet=lambda: self.speech.wait(30))
+            query = self.voice_capture.get()
+            return "exit" if query is None else query
         try:
-            # Try using termux-speech-to-text for voice input
-            result = subprocess.run(["termux-speech-to-text"], capture_output=True, text=True, timeout=10)
-            query = result.stdout.strip().lower()
-            if query:
-                return query
-        except (subprocess.CalledProcessError, subprocess.TimeoutExpired):
-            print("Voice input failed or not detected. Please type your command.")
-        return input("Input: ").lower().strip()
+            return input("Input: ").lower().strip()
+        except EOFError:
+            return "exit"
 
+    @COMMANDS.prefix("explain ", "what is ", "tell me about ")
+    @COMMANDS.fallback
     def query_gemini_api(self, query):
         """Send a query to the Google Gemini API and return the response."""
+        cached = self.response_cache.get(query)
+        if cached is not None:
+            print(f"Output: {cached}")
+            self.speak(cached)
+            return cached
+
         if not self.check_internet():
+            stale = self.response_cache.get(query, allow_stale=True)
+            if stale is not None:
+                print(f"Output: (offline, cached answer) {stale}")
+                self.speak(stale)
+                return stale
             print("Output: Gemini API requires an internet connection.")
             self.speak("This feature requires an internet connection.")
             return
@@ -105,10 +2292,44 @@ class IshaAssistant:
             self.speak("Gemini API key not found.")
             return
 
-        url = "https://generativelanguage.googleapis.com/v1beta/models/gemini-1.5-flash:generateContent"
+        payload, headers = self.gemini_request(query)
+        requests = lazy_import("requests")
+        try:
+            if self.stream:
+                generated_text = self.stream_gemini_response(payload, headers)
+                if generated_text and not self.cancelled():
+                    self.response_cache.put(query, generated_text)
+            else:
+                generated_text = self.fetch_gemini_answer(query)
+                if self.cancelled():
+                    logging.info(f"Dropped the answer to cancelled query {query!r}")
+                    return None
+                print(f"Output: {generated_text or 'No response from API'}")
+                self.speak(generated_text or "No response from API")
+            return generated_text
+        except (requests.exceptions.ConnectionError, requests.exceptions.Timeout) as e:
+            logging.error(f"Gemini API unreachable: {str(e)}")
+            if self.cancelled():
+                return None
+            stale = self.response_cache.get(query, allow_stale=True)
+            if stale is not None:
+                print(f"Output: (offline, cached answer) {stale}")
+                self.speak(stale)
+                return stale
+            print(f"Output: Failed to get a response from the Gemini API: {str(e)}")
+            self.speak("Failed to get a response from the Gemini API")
+        except requests.exceptions.RequestException as e:
+            logging.error(f"Gemini API error: {str(e)} - Response: {e.response.text if e.response is not None else 'No response'}")
+            if self.cancelled():
+                return None
+            print(f"Output: Failed to get a response from the Gemini API: {str(e)}")
+            self.speak("Failed to get a response from the Gemini API")
+
+    def gemini_request(self, query):
+        """Return the JSON payload and headers for a Gemini request."""
         headers = {
             "Content-Type": "application/json",
-            "X-goog-api-key": api_key
+            "X-goog-api-key": os.getenv("GEMINI_API_KEY", "")
         }
         payload = {
             "contents": [
@@ -119,83 +2340,243 @@ class IshaAssistant:
                 }
             ]
         }
+        return payload, headers
 
-        try:
-            response = requests.post(url, json=payload, headers=headers)
-            response.raise_for_status()
-            result = response.json()
-            generated_text = result.get("candidates", [{}])[0].get("content", {}).get("parts", [{}])[0].get("text", "No response from API")
-            print(f"Output: {generated_text}")
-            self.speak(generated_text)
-        except requests.exceptions.RequestException as e:
-            logging.error(f"Gemini API error: {str(e)} - Response: {e.response.text if e.response else 'No response'}")
-            print(f"Output: Failed to get a response from the Gemini API: {str(e)}")
-            self.speak("Failed to get a response from the Gemini API")
+    def fetch_gemini_answer(self, query):
+        """Fetch a Gemini answer without printing it and store it in the response cache."""
+        payload, headers = self.gemini_request(query)
+        response = self.http.post(f"{GEMINI_MODEL_URL}:generateContent", json=payload, headers=headers)
+        generated_text = gemini_text(response.json())
+        if generated_text and not self.cancelled():
+            self.response_cache.put(query, generated_text)
+        return generated_text
+
+    def warm_caches(self):
+        """Prefetch weather and Gemini answers for habitual queries once online."""
+        self.weather.prefetch()
+        if not os.getenv("GEMINI_API_KEY"):
+            return
+        for command, count in self.history.frequent("query_gemini_api", HISTORY_WARM_QUERIES):
+            if count >= 2 and not self.response_cache.fresh(command):
+                self.jobs.submit(f"warm the answer for {command!r}", self.fetch_gemini_answer, command,
+                                 announce_failure=False)
 
-    def process_command(self, command):
-        """Process user commands and execute corresponding actions."""
-        logging.info(f"Processing command: {command}, Internet: {self.internet_status}")
+    def stream_gemini_response(self, payload, headers):
+        """Print and speak a streamed Gemini answer one sentence at a time."""
+        url = f"{GEMINI_MODEL_URL}:streamGenerateContent"
+        with self.http.post(url, params={"alt": "sse"}, json=payload, headers=headers, stream=True) as response:
+            response.encoding = "utf-8"
+            pending = ""
+            spoken = []
+            for line in response.iter_lines(decode_unicode=True):
+                if self.cancelled():
+                    # Closing the response stops the download
+                    print()
+                    return None
+                if not line or not line.startswith("data:"):
+                    continue
+                pending += gemini_text(json.loads(line[5:]))
+                *sentences, pending = SENTENCE_END.split(pending)
+                for sentence in sentences:
+                    self._emit_sentence(sentence, spoken)
+            if pending.strip():
+                self._emit_sentence(pending.strip(), spoken)
+        if not spoken:
+            sys.stdout.write("Output: No response from API")
+            self.speak("No response from API")
+        print()
+        return " ".join(spoken)
+
+    def _emit_sentence(self, sentence, spoken):
+        sys.stdout.write(f"{' ' if spoken else 'Output: '}{sentence}")
+        sys.stdout.flush()
+        self.speak(sentence, continues=bool(spoken))
+        spoken.append(sentence)
+
+    def process_command(self, command, cancel_event=None):
+        """Process user commands and execute corresponding actions.
+
+        cancel_event, when set by the async core after a timeout or
+        "cancel", tells slow handlers to drop their result; see cancelled().
+        """
+        self.local.cancel_event = cancel_event
+        logging.info(f"Processing command: {command}, Internet: {self.connectivity.online}")
         print(f"Input: {command}")
 
-        if command.startswith("explain ") or command.startswith("what is ") or command.startswith("tell me about "):
-            self.query_gemini_api(command)
-        elif command in ["what is the time", "samaye kya ho raha hai", "time"]:
-            self.get_time()
-        elif command in ["what is the date", "aaj date kya hai", "date"]:
-            self.get_date()
-        elif command.startswith("solve ") or re.match(r"^\d+\s*[\+\-\*/]\s*\d+", command):
-            expression = command[6:] if command.startswith("solve ") else command
-            self.solve_math(expression)
-        elif command in ["open file explorer", "open file m"]:
-            self.open_file_explorer()
-        elif command in ["open downloads"]:
-            self.open_downloads()
-        elif command in ["play song", "play music", "isha play song"]:
-            self.play_song()
-        elif command in ["youtube", "isha youtube", "manoranjan suru kiya jaaye"]:
-            self.open_youtube()
-        elif command in ["google", "isha open google", "google open now", "open google"]:
-            self.open_google()
-        elif command in ["instagram", "isha open instagram", "instagram chalu karo", "gili gili chu", "gili gili chhu", "gili gili suit"]:
-            self.open_instagram()
-        elif command in ["download photo", "download picture", "isha download photo", "isha download picture", "dd photo", "dd picture"]:
-            self.download_picture()
-        elif command in ["download reel", "download storie", "download instagram reel", "instagram reel download", "isha download instagram reel", "download instagram stories", "download instagram storie", "isha downloas instagram storie", "isha instagram storie download", "isha instagram stories download", "ist reel"]:
-            self.download_instagram_reel()
-        elif command in ["whatsapp", "isha whatsapp"]:
-            self.open_whatsapp()
-        elif command in ["hello", "hello isha", "hi", "hi isha"]:
-            self.hello()
-        elif command in ["thank you isha", "thank you", "thanks isha"]:
-            self.thank_you_reply()
-        elif command in ["what you mane", "what is your name"]:
-            self.what_is_your_name()
-        elif command in ["good morning", "morning", "good morning isha", "isha good morning"]:
-            self.morningtime()
-        elif command in ["stop song", "stop", "stop music", "isha song band karo"]:
-            self.stop_song()
-        elif command in ["weather", "isha what is weather", "aaj ka mausam kya hai"]:
-            self.get_weather()
-        elif command in ["find now", "give me a answer", "isha find now", "search", "search now", "isha search now"]:
-            self.find_now()
-        elif command == "greet me":
-            self.wish_me()
-        elif command == "exit":
-            print("Output: Exiting Isha Assistant")
-            self.speak("Goodbye")
-            return False
-        else:
-            self.query_gemini_api(command)
-        return True
+        # A new command cuts off whatever is still being read out.
+        self.speech.interrupt()
+        METRICS.begin_command()
+        handler = None
+        failed = True
+        try:
+            with METRICS.span("dispatch"):
+                handler, args = COMMANDS.resolve(command)
+            if handler.__name__ not in ("repeat_command", "show_history", "search_history", "exit_assistant"):
+                self.history.append(command, handler.__name__)
+            result = handler(self, *args)
+            if inspect.isawaitable(result):
+                # A coroutine handler called from synchronous code (batch, daemon, run)
+                result = lazy_import("asyncio").run(result)
+            failed = False
+        finally:
+            METRICS.end_command(command, handler.__name__ if handler else "unknown", error=failed)
+            self.local.cancel_event = None
+        return result is not False
+
+    def cancelled(self):
+        """Return True if the command running on this thread was cancelled or timed out."""
+        event = getattr(self.local, "cancel_event", None)
+        return event is not None and event.is_set()
+
+    @COMMANDS.phrase("stats", "isha stats", "show stats")
+    def show_stats(self):
+        """Report command counts and latencies and write them to the stats file."""
+        data = METRICS.dump(extra={"response_cache": self.response_cache.stats()})
+        commands = data["histograms"].get("command", Histogram().to_dict())
+        print(f"Output: {data['counters'].get('commands', 0)} commands, {data['counters'].get('errors', 0)} errors, "
+              f"p50 {commands['p50_ms']} ms, p95 {commands['p95_ms']} ms")
+        for name, histogram in data["histograms"].items():
+            if name.startswith(("handler.", "phase.")) or name in ("tts", "listen"):
+                print(f"  {name:<32} {histogram['count']:6d} calls  mean {histogram['mean_ms']:9.1f} ms  "
+                      f"p95 <= {histogram['p95_ms']} ms")
+        cache = data["response_cache"]
+        print(f"  response cache: {cache['hits']} hits, {cache['misses']} misses, {cache['entries']} entries")
+        print(f"Output: Stats written to {STATS_PATH}")
+        self.speak(f"{data['counters'].get('commands', 0)} commands handled so far")
+
+    @COMMANDS.phrase("exit")
+    @COMMANDS.interactive
+    def exit_assistant(self):
+        """Say goodbye and stop the main loop."""
+        print("Output: Exiting Isha Assistant")
+        self.speak("Goodbye")
+        return False
 
     def run(self):
         """Main loop for the assistant."""
         print("Isha Assistant is running. Type 'exit' to quit.")
+        if self.startup_report:
+            print(STARTUP_TIMER.report())
+        if self.prewarm:
+            prewarm_imports()
         while True:
             command = self.listen()
             if not self.process_command(command):
                 break
+            if self.prearm and self.voice_capture is not None:
+                # Start the recognizer as soon as the answer has been read out
+                self.voice_capture.arm()
+        self.shutdown()
+
+    def run_async(self):
+        """Main loop on asyncio: several commands can be in flight at once."""
+        print("Isha Assistant is running. Type 'exit' to quit, 'cancel' to stop running commands.")
+        if self.startup_report:
+            print(STARTUP_TIMER.report())
+        if self.prewarm:
+            prewarm_imports()
+        try:
+            lazy_import("asyncio").run(AsyncCore(self).run())
+        finally:
+            self.shutdown()
 
+    def run_batch(self, lines, output=sys.stdout):
+        """Run commands from an iterable of lines and write one JSON result per command.
+
+        Follow-up prompts (a city for "weather", a query for "google") read
+        the next line. Blank lines and lines starting with "#" are skipped.
+        A summary with throughput and latency percentiles is written last.
+        """
+        self.headless = True
+        self.local.client = "batch"
+        self.input_lines = (line.strip() for line in lines if line.strip() and not line.lstrip().startswith("#"))
+        timings = []
+        batch_start = time.perf_counter()
+        for index, command in enumerate(self.input_lines):
+            record, keep_going = self.execute(command)
+            timings.append(record["seconds"])
+            output.write(json.dumps(dict(record, index=index)) + "\n")
+            output.flush()
+            if not keep_going:
+                break
+        total = time.perf_counter() - batch_start
+        timings.sort()
+        summary = {
+            "commands": len(timings),
+            "total_seconds": round(total, 6),
+            "commands_per_second": round(len(timings) / total, 2) if total > 0 else None,
+            "p50_seconds": round(percentile(timings, 50), 6) if timings else None,
+            "p95_seconds": round(percentile(timings, 95), 6) if timings else None,
+        }
+        output.write(json.dumps({"summary": summary}) + "\n")
+        output.flush()
+        self.input_lines = None
+        self.shutdown()
+        return summary
+
+    def execute(self, command):
+        """Run one command with its printed output captured.
+
+        Returns (record, keep_going), where record holds the command, the
+        handler, the elapsed seconds, the output lines and any error.
+        """
+        command = command.lower().strip()
+        handler, _ = COMMANDS.resolve(command)
+        error = None
+        start = time.perf_counter()
+        with output_capture().capture() as captured:
+            try:
+                keep_going = self.process_command(command)
+            except Exception as e:
+                logging.exception(f"Command failed: {command}")
+                error = f"{type(e).__name__}: {str(e)}"
+                keep_going = True
+        elapsed = time.perf_counter() - start
+        record = {
+            "command": command,
+            "handler": handler.__name__,
+            "seconds": round(elapsed, 6),
+            "output": [line for line in captured.getvalue().splitlines() if not line.startswith("Input: ")],
+            "error": error,
+        }
+        with self.notifications_lock:
+            notifications = self.notifications.pop(getattr(self.local, "client", None), None)
+        if notifications:
+            record["notifications"] = list(notifications)
+        return record, keep_going
+
+    def serve(self, path=SOCKET_PATH):
+        """Serve commands over a Unix socket until a client asks the daemon to stop."""
+        try:
+            server = AssistantServer(self, path)
+        except DaemonRunning:
+            self.shutdown()
+            raise
+        self.headless = True
+        print(f"Isha Assistant daemon listening on {path}")
+        logging.info(f"Daemon listening on {path}")
+        prewarm_imports()
+        try:
+            server.serve_forever()
+        except KeyboardInterrupt:
+            pass
+        finally:
+            server.server_close()
+            self.shutdown()
+
+    def shutdown(self):
+        """Stop background workers and close the caches and HTTP session."""
+        METRICS.dump(extra={"response_cache": self.response_cache.stats()})
+        if self.voice_capture is not None:
+            self.voice_capture.cancel()
+        self.jobs.shutdown()
+        self.connectivity.stop()
+        self.speech.close()
+        self.http.close()
+        self.response_cache.close()
+        self.history.close()
+
+    @COMMANDS.phrase("what is the time", "samaye kya ho raha hai", "time")
     def get_time(self):
         """Display the current time."""
         try:
@@ -207,6 +2588,7 @@ class IshaAssistant:
             print(f"Output: Error retrieving time: {str(e)}")
             self.speak("Error retrieving time")
 
+    @COMMANDS.phrase("what is the date", "aaj date kya hai", "date")
     def get_date(self):
         """Display the current date."""
         try:
@@ -218,12 +2600,13 @@ class IshaAssistant:
             print(f"Output: Error retrieving date: {str(e)}")
             self.speak("Error retrieving date")
 
+    @COMMANDS.prefix("solve ", strip=True)
+    @COMMANDS.pattern(r"^\d+\s*[\+\-\*/]\s*\d+")
     def solve_math(self, expression):
-        """Solve a mathematical expression using sympy."""
+        """Solve a mathematical expression, using sympy only for symbolic input."""
         try:
-            expression = expression.strip().replace(" ", "")
-            expr = sympify(expression, locals={"sin": sin, "cos": cos, "tan": tan, "sqrt": sqrt, "pi": pi})
-            result = expr.evalf()
+            result, tier = self.math.solve(expression)
+            logging.info(f"Solved {expression!r} with the {tier} tier")
             response = f"The result is {result}"
             print(f"Output: {response}")
             self.speak(response)
@@ -231,30 +2614,40 @@ class IshaAssistant:
             print(f"Output: Sorry, I couldn't solve that math problem: {str(e)}")
             self.speak("Sorry, I couldn't solve that math problem")
 
+    @COMMANDS.phrase("open file explorer", "open file m")
     def open_file_explorer(self):
         """Open Termux file explorer."""
-        try:
-            subprocess.run(["termux-open", os.path.expanduser("~")], check=True)
+        if self.open_local(os.path.expanduser("~"), "open file explorer"):
             print("Output: Opening file explorer")
             self.speak("Opening file explorer")
-        except subprocess.CalledProcessError as e:
-            print(f"Output: Failed to open file explorer: {str(e)}")
-            self.speak("Failed to open file explorer")
 
+    @COMMANDS.phrase("open downloads")
     def open_downloads(self):
         """Open the Downloads folder."""
-        try:
-            downloads_path = os.path.join(os.path.expanduser("~"), "downloads")
-            subprocess.run(["termux-open", downloads_path], check=True)
+        downloads_path = os.path.join(os.path.expanduser("~"), "downloads")
+        if self.open_local(downloads_path, "open Downloads folder"):
             print("Output: Opening Downloads folder")
             self.speak("Opening Downloads folder")
-        except subprocess.CalledProcessError as e:
-            print(f"Output: Failed to open Downloads folder: {str(e)}")
-            self.speak("Failed to open Downloads folder")
 
-    def play_song(self):
-        """Play a song from YouTube or a local file."""
-        if self.check_internet():
+    @COMMANDS.phrase("play song", "play music", "isha play song")
+    @COMMANDS.prefix("play song ", "play music ", "isha play song ", strip=True)
+    def play_song(self, name=None):
+        """Play a named or random song from the local library or YouTube."""
+        if name:
+            matches = self.media.search("music", name)
+            if matches:
+                if not self.open_local(matches[0], "play the song"):
+                    return
+                print(f"Output: Playing local music file: {os.path.basename(matches[0])}")
+                self.speak(f"Playing {os.path.splitext(os.path.basename(matches[0]))[0]}")
+            elif self.check_internet():
+                print(f"Output: No local song matches {name}")
+                self.open_url(f"https://www.youtube.com/results?search_query={name}", f"search YouTube for {name}",
+                              f"Searching YouTube for {name}")
+            else:
+                print(f"Output: No internet connection and no local song matches {name}")
+                self.speak(f"No local song matches {name}")
+        elif self.check_internet():
             playlist_links = [
                 "https://youtu.be/bzSTpdcs-EI?si=TPrjRhE4pRVjO0Hh",
                 "https://youtu.be/j9GxZ6MtJSU?si=jQM2uGAnbxt356MO",
@@ -263,21 +2656,33 @@ class IshaAssistant:
                 "https://youtu.be/xPfzx5F-8aw?si=GvwUrqZY7nclNN2M",
             ]
             url = random.choice(playlist_links)
-            subprocess.run(["termux-open-url", url], check=True)
-            print("Output: Playing a song from YouTube")
-            self.speak("Playing a song from YouTube")
+            self.open_url(url, "open a YouTube song", "Playing a song from YouTube")
         else:
-            music_dir = os.path.join(os.path.expanduser("~"), "music")
-            music_files = glob.glob(os.path.join(music_dir, "*.mp3")) + glob.glob(os.path.join(music_dir, "*.wav"))
-            if music_files:
-                music_file = random.choice(music_files)
-                subprocess.run(["termux-open", music_file], check=True)
+            music_file = self.media.shuffle("music")
+            if music_file:
+                if not self.open_local(music_file, "play the music file"):
+                    return
                 print(f"Output: Playing local music file: {os.path.basename(music_file)}")
                 self.speak("Playing a local music file")
             else:
                 print("Output: No internet connection and no local music files found")
                 self.speak("No internet connection and no local music files found")
 
+    @COMMANDS.prefix("play video ", strip=True)
+    def play_video(self, name):
+        """Play a local video file whose name matches."""
+        matches = self.media.search("video", name)
+        if matches:
+            if not self.open_local(matches[0], "play the video"):
+                return
+            print(f"Output: Playing local video: {os.path.basename(matches[0])}")
+            self.speak(f"Playing {os.path.splitext(os.path.basename(matches[0]))[0]}")
+        else:
+            print(f"Output: No local video matches {name}")
+            self.speak(f"No local video matches {name}")
+
+    @COMMANDS.phrase("youtube", "isha youtube", "manoranjan suru kiya jaaye")
+    @COMMANDS.interactive
     def open_youtube(self):
         """Open YouTube and optionally search for a query."""
         if self.check_internet():
@@ -286,19 +2691,27 @@ class IshaAssistant:
             query = self.listen()
             if query and query not in ["none", "cancel", "no"]:
                 url = f"https://www.youtube.com/results?search_query={query}"
-                subprocess.run(["termux-open-url", url], check=True)
-                print(f"Output: Searching for {query} on YouTube")
-                self.speak(f"Searching for {query} on YouTube")
+                self.open_url(url, f"search YouTube for {query}", f"Searching for {query} on YouTube")
             else:
-                subprocess.run(["termux-open-url", "https://www.youtube.com"], check=True)
-                print("Output: Opening YouTube")
-                self.speak("Opening YouTube")
+                self.open_url("https://www.youtube.com", "open YouTube", "Opening YouTube")
         else:
-            print("Output: No internet connection. Opening local video folder.")
-            self.speak("No internet connection. Opening local video folder.")
-            video_dir = os.path.join(os.path.expanduser("~"), "videos")
-            subprocess.run(["termux-open", video_dir], check=True)
+            print("No internet connection. Which local video do you want to play? (or type 'none' to open the folder)")
+            self.speak("No internet connection. Which local video do you want to play?")
+            query = self.listen()
+            matches = self.media.search("video", query) if query and query not in ["none", "cancel", "no"] else []
+            if matches:
+                if not self.open_local(matches[0], "play the video"):
+                    return
+                print(f"Output: Playing local video: {os.path.basename(matches[0])}")
+                self.speak(f"Playing {os.path.splitext(os.path.basename(matches[0]))[0]}")
+            else:
+                video_dir = os.path.join(os.path.expanduser("~"), "videos")
+                if self.open_local(video_dir, "open the local video folder"):
+                    print("Output: Opening local video folder.")
+                    self.speak("Opening local video folder.")
 
+    @COMMANDS.phrase("google", "isha open google", "google open now", "open google")
+    @COMMANDS.interactive
     def open_google(self):
         """Open Google and optionally search for a query."""
         if self.check_internet():
@@ -307,48 +2720,49 @@ class IshaAssistant:
             query = self.listen()
             if query and query not in ["none", "cancel", "no"]:
                 url = f"https://www.google.com/search?q={query}"
-                subprocess.run(["termux-open-url", url], check=True)
-                print(f"Output: Searching for {query} on Google")
-                self.speak(f"Searching for {query} on Google")
+                self.open_url(url, f"search Google for {query}", f"Searching for {query} on Google")
             else:
-                subprocess.run(["termux-open-url", "https://www.google.com"], check=True)
-                print("Output: Opening Google")
-                self.speak("Opening Google")
+                self.open_url("https://www.google.com", "open Google", "Opening Google")
         else:
             print("Output: No internet connection. Opening local file explorer.")
             self.speak("No internet connection. Opening local file explorer.")
-            subprocess.run(["termux-open", os.path.expanduser("~")], check=True)
+            self.open_local(os.path.expanduser("~"), "open the local file explorer")
 
+    @COMMANDS.phrase("instagram", "isha open instagram", "instagram chalu karo",
+                     "gili gili chu", "gili gili chhu", "gili gili suit")
     def open_instagram(self):
         """Open Instagram."""
         if self.check_internet():
-            subprocess.run(["termux-open-url", "https://www.instagram.com"], check=True)
-            print("Output: Opening Instagram")
-            self.speak("Opening Instagram")
+            self.open_url("https://www.instagram.com", "open Instagram", "Opening Instagram")
         else:
             print("Output: Instagram requires an internet connection.")
             self.speak("Instagram requires an internet connection.")
 
+    @COMMANDS.phrase("download photo", "download picture", "isha download photo",
+                     "isha download picture", "dd photo", "dd picture")
     def download_picture(self):
         """Open Pixabay for downloading pictures."""
         if self.check_internet():
-            subprocess.run(["termux-open-url", "https://pixabay.com/"], check=True)
-            print("Output: Opening Pixabay to download pictures")
-            self.speak("Opening Pixabay to download pictures")
+            self.open_url("https://pixabay.com/", "open Pixabay", "Opening Pixabay to download pictures")
         else:
             print("Output: Downloading pictures requires an internet connection.")
             self.speak("Downloading pictures requires an internet connection.")
 
+    @COMMANDS.phrase("download reel", "download storie", "download instagram reel", "instagram reel download",
+                     "isha download instagram reel", "download instagram stories", "download instagram storie",
+                     "isha downloas instagram storie", "isha instagram storie download",
+                     "isha instagram stories download", "ist reel")
     def download_instagram_reel(self):
         """Open a website to download Instagram reels."""
         if self.check_internet():
-            subprocess.run(["termux-open-url", "https://igram.world/reels-downloader/"], check=True)
-            print("Output: Opening Instagram reel downloader")
-            self.speak("Opening Instagram reel downloader")
+            self.open_url("https://igram.world/reels-downloader/", "open the Instagram reel downloader",
+                          "Opening Instagram reel downloader")
         else:
             print("Output: Downloading reels requires an internet connection.")
             self.speak("Downloading reels requires an internet connection.")
 
+    @COMMANDS.phrase("whatsapp", "isha whatsapp")
+    @COMMANDS.interactive
     def open_whatsapp(self):
         """Open WhatsApp and send a message if specified."""
         if not self.check_internet():
@@ -364,13 +2778,14 @@ class IshaAssistant:
             self.speak("What message should I send?")
             message = self.listen()
             if message and message not in ["none", "cancel", "no"]:
-                try:
-                    pywhatkit.sendwhatmsg_instantly(contact, message, wait_time=20, tab_close=True)
-                    print(f"Output: Message sent to {contact}")
-                    self.speak(f"Message sent to {contact}")
-                except Exception as e:
-                    print(f"Output: Failed to send WhatsApp message: {str(e)}")
-                    self.speak(f"Failed to send WhatsApp message")
+                job = self.jobs.submit(f"send a WhatsApp message to {contact}", self.send_whatsapp_message,
+                                       contact, message, success_message=f"Message sent to {contact}")
+                if job is None:
+                    print("Output: Too many background jobs are running. Please try again shortly.")
+                    self.speak("Too many background jobs are running")
+                else:
+                    print(f"Output: Sending message to {contact} in the background (job {job.id})")
+                    self.speak(f"Sending message to {contact}")
             else:
                 print("Output: No message provided")
                 self.speak("No message provided")
@@ -378,6 +2793,73 @@ class IshaAssistant:
             print("Output: Invalid or no contact provided")
             self.speak("Invalid or no contact provided")
 
+    def send_whatsapp_message(self, contact, message):
+        """Send a WhatsApp message with pywhatkit (blocks for 20+ seconds)."""
+        pywhatkit = lazy_import("pywhatkit")
+        pywhatkit.sendwhatmsg_instantly(contact, message, wait_time=20, tab_close=True)
+
+    @COMMANDS.phrase("jobs", "isha jobs", "show jobs")
+    def show_jobs(self):
+        """List recent background jobs and their status."""
+        jobs = list(self.jobs.jobs.values())
+        if not jobs:
+            print("Output: No background jobs")
+            self.speak("No background jobs")
+            return
+        for job in jobs:
+            detail = f" ({job.error})" if job.error else ""
+            print(f"Output: Job {job.id}: {job.description} - {job.status}{detail}")
+        active = len(self.jobs.active())
+        self.speak(f"{active} job{'s' if active != 1 else ''} running")
+
+    @COMMANDS.phrase("repeat", "repeat last", "again", "isha repeat")
+    @COMMANDS.pattern(r"^repeat \d+$")
+    def repeat_command(self, command=None):
+        """Run a previous command again ("repeat" or "repeat <n>" for the n-th last one)."""
+        previous = self.repeated_command(command)
+        if previous is None:
+            print("Output: There is no command to repeat")
+            self.speak("There is no command to repeat")
+            return
+        print(f"Output: Repeating {previous}")
+        # Run inline rather than through process_command, so the repeat is
+        # timed and logged as one command.
+        handler, args = COMMANDS.resolve(previous)
+        self.history.append(previous, handler.__name__)
+        return handler(self, *args)
+
+    def repeated_command(self, command=None):
+        """Return the earlier command a repeat refers to, or None."""
+        previous = self.history.get(int(command.split()[-1]) if command else 1)
+        # Histories written before exit was left out still end sessions with it
+        if previous is None or COMMANDS.resolve(previous)[0] is IshaAssistant.exit_assistant:
+            return None
+        return previous
+
+    @COMMANDS.phrase("history", "show history", "isha history")
+    @COMMANDS.pattern(r"^history \d+$")
+    def show_history(self, command=None):
+        """Show the last 10 commands, or the last n for "history <n>"."""
+        count = int(command.split()[-1]) if command else 10
+        self._print_history("Recent commands", self.history.recent(count))
+
+    @COMMANDS.prefix("history search ", strip=True)
+    def search_history(self, text):
+        """Show earlier commands starting with some text, most used first."""
+        text = text.strip()
+        self._print_history(f"Commands starting with {text!r}", self.history.search(text) if text else [])
+
+    def _print_history(self, title, commands):
+        if not commands:
+            print("Output: No matching commands in history")
+            self.speak("No matching commands in history")
+            return
+        print(f"Output: {title}:")
+        for position, command in enumerate(commands, 1):
+            print(f"  {position}. {command}")
+        self.speak(f"{len(commands)} command{'s' if len(commands) != 1 else ''} found")
+
+    @COMMANDS.phrase("hello", "hello isha", "hi", "hi isha")
     def hello(self):
         """Respond to a greeting."""
         responses = ["Hi!", "Kaise ho?"]
@@ -385,6 +2867,7 @@ class IshaAssistant:
         print(f"Output: {response}")
         self.speak(response)
 
+    @COMMANDS.phrase("thank you isha", "thank you", "thanks isha")
     def thank_you_reply(self):
         """Respond to a thank you."""
         responses = ["Welcome, I can help you!", "Welcome!"]
@@ -392,6 +2875,7 @@ class IshaAssistant:
         print(f"Output: {response}")
         self.speak(response)
 
+    @COMMANDS.phrase("what you mane", "what is your name")
     def what_is_your_name(self):
         """Respond with the assistant's name."""
         responses = ["I am Isha", "My name is Isha"]
@@ -399,6 +2883,7 @@ class IshaAssistant:
         print(f"Output: {response}")
         self.speak(response)
 
+    @COMMANDS.phrase("good morning", "morning", "good morning isha", "isha good morning")
     def morningtime(self):
         """Respond to a morning greeting."""
         responses = ["Good morning", "Morning there, kaise ho?"]
@@ -406,47 +2891,61 @@ class IshaAssistant:
         print(f"Output: {response}")
         self.speak(response)
 
+    @COMMANDS.phrase("stop song", "stop", "stop music", "isha song band karo")
     def stop_song(self):
         """Stop media playback (limited functionality in Termux)."""
         print("Output: Stopping media (not fully supported in Termux)")
         self.speak("Stopping media")
 
+    @COMMANDS.phrase("weather", "isha what is weather", "aaj ka mausam kya hai")
+    @COMMANDS.interactive
     def get_weather(self):
         """Fetch weather information for a specified city."""
-        if self.check_internet():
-            print("Which city's weather do you want to check?")
-            self.speak("Which city's weather do you want to check?")
-            city = self.listen()
-            if not city or city in ["none", "cancel", "no"]:
-                print("Output: No city provided. Please try again.")
-                self.speak("No city provided. Please try again.")
-                return
-            try:
-                response = requests.get(f"https://wttr.in/{city}?format=3")
-                response.raise_for_status()
-                weather_info = response.text
-                with open("weather_cache.txt", "w") as f:
-                    f.write(f"{city}:{weather_info}:{int(time.time())}")
+        print("Which city's weather do you want to check?")
+        self.speak("Which city's weather do you want to check?")
+        city = self.listen()
+        if not city or city in ["none", "cancel", "no"]:
+            print("Output: No city provided. Please try again.")
+            self.speak("No city provided. Please try again.")
+            return
+
+        online = self.check_internet()
+        weather_info, age = self.weather.lookup(city)
+        if weather_info is not None and age < self.weather.max_age:
+            if online:
+                if age > self.weather.refresh_after:
+                    self.weather.refresh_in_background(city)
                 print(f"Output: {weather_info}")
                 self.speak(weather_info)
-            except Exception as e:
-                print(f"Output: Failed to fetch weather for {city}: {str(e)}")
-                self.speak(f"Failed to fetch weather for {city}")
-        else:
-            try:
-                with open("weather_cache.txt", "r") as f:
-                    city, weather_info, timestamp = f.read().split(":", 2)
-                    age = int(time.time()) - int(timestamp)
-                    if age < 3600:
-                        print(f"Output: Cached weather for {city}: {weather_info}")
-                        self.speak(f"No internet. Showing cached weather for {city}: {weather_info}")
-                    else:
-                        print("Output: No internet and cached weather is too old.")
-                        self.speak("No internet and cached weather is too old.")
-            except FileNotFoundError:
+            else:
+                print(f"Output: Cached weather for {city}: {weather_info}")
+                self.speak(f"No internet. Showing cached weather for {city}: {weather_info}")
+            return
+
+        if not online:
+            if weather_info is not None:
+                print("Output: No internet and cached weather is too old.")
+                self.speak("No internet and cached weather is too old.")
+            else:
                 print("Output: No internet and no cached weather available.")
                 self.speak("No internet and no cached weather available.")
+            return
+
+        try:
+            weather_info = self.weather.fetch(city)
+            if self.cancelled():
+                # The report is still stored, it is only no longer announced
+                return
+            print(f"Output: {weather_info}")
+            self.speak(weather_info)
+        except Exception as e:
+            if self.cancelled():
+                return
+            print(f"Output: Failed to fetch weather for {city}: {str(e)}")
+            self.speak(f"Failed to fetch weather for {city}")
 
+    @COMMANDS.phrase("find now", "give me a answer", "isha find now", "search", "search now", "isha search now")
+    @COMMANDS.interactive
     def find_now(self):
         """Search for a query on Google."""
         if self.check_internet():
@@ -454,17 +2953,101 @@ class IshaAssistant:
             self.speak("Tell me what to search")
             search_query = self.listen()
             if search_query and search_query not in ["none", "cancel", "no"]:
-                subprocess.run(["termux-open-url", f"https://www.google.com/search?q={search_query}"], check=True)
-                print(f"Output: Searching for {search_query} on Google")
-                self.speak(f"Searching for {search_query} on Google")
+                self.open_url(f"https://www.google.com/search?q={search_query}", f"search Google for {search_query}",
+                              f"Searching for {search_query} on Google")
             else:
                 print("Output: No search query provided")
                 self.speak("No search query provided")
         else:
             print("Output: No internet connection. Opening local file explorer.")
             self.speak("No internet connection. Opening local file explorer.")
-            subprocess.run(["termux-open", os.path.expanduser("~")], check=True)
+            self.open_local(os.path.expanduser("~"), "open the local file explorer")
+
+def main(argv=None):
+    """Parse command-line options and start the assistant."""
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Isha Assistant for Termux")
+    parser.add_argument("--startup-report", action="store_true",
+                        help="print import and initialization timings when the prompt comes up")
+    parser.add_argument("--prewarm", action="store_true",
+                        default=os.getenv("ISHA_PREWARM", "") not in ("", "0"),
+                        help="import heavy modules in the background once the prompt is up")
+    parser.add_argument("--text-only", action="store_true",
+                        default=os.getenv("ISHA_TEXT_ONLY", "") not in ("", "0"),
+                        help="print responses without starting termux-tts-speak")
+    parser.add_argument("--stream", action="store_true",
+                        default=os.getenv("ISHA_STREAM", "") not in ("", "0"),
+                        help="print and speak Gemini answers sentence by sentence as they arrive")
+    parser.add_argument("--bench-math", action="store_true",
+                        help="compare the arithmetic and sympy tiers of the math engine and exit")
+    parser.add_argument("--check-fuzzy", action="store_true",
+                        help="run the fuzzy command matcher against its misspelling corpus and exit")
+    parser.add_argument("--no-voice", action="store_true",
+                        help="disable both speech output and voice capture")
+    parser.add_argument("--batch", metavar="FILE",
+                        help="run commands from FILE ('-' for stdin) and print JSON results instead of prompting")
+    parser.add_argument("--batch-output", metavar="FILE",
+                        help="write batch results to FILE instead of stdout")
+    parser.add_argument("--async", dest="use_async", action="store_true",
+                        default=os.getenv("ISHA_ASYNC", "") not in ("", "0"),
+                        help="run commands concurrently on an asyncio core loop")
+    parser.add_argument("--daemon", action="store_true",
+                        help="keep one assistant running and serve commands over a Unix socket")
+    parser.add_argument("--send", metavar="COMMAND",
+                        help="send COMMAND to a running daemon and print the result")
+    parser.add_argument("--input", action="append", default=[], metavar="TEXT",
+                        help="answer to a follow-up prompt of --send (repeatable)")
+    parser.add_argument("--json", action="store_true", help="print the daemon's raw JSON response")
+    parser.add_argument("--stop-daemon", action="store_true", help="ask a running daemon to exit")
+    parser.add_argument("--socket", default=SOCKET_PATH, help=f"daemon socket path (default {SOCKET_PATH})")
+    args = parser.parse_args(argv)
+    if args.send is not None or args.stop_daemon:
+        try:
+            response = send_command(args.send, args.input, path=args.socket, shutdown=args.stop_daemon)
+        except OSError as e:
+            print(f"Output: Could not reach the Isha Assistant daemon at {args.socket}: {str(e)}")
+            return 1
+        if args.json:
+            print(json.dumps(response))
+        else:
+            for line in response.get("output", []):
+                print(line)
+            if response.get("error"):
+                print(f"Output: Error: {response['error']}")
+            for text in response.get("notifications", []):
+                print(f"Output: {text}")
+        return 0 if response.get("ok") else 1
+    if args.bench_math:
+        benchmark_math()
+        return
+    if args.check_fuzzy:
+        return 0 if evaluate_fuzzy_matcher() else 1
+    assistant = IshaAssistant(startup_report=args.startup_report, prewarm=args.prewarm, text_only=args.text_only,
+                              stream=args.stream, voice=not args.no_voice and not args.batch,
+                              use_async=args.use_async)
+    if args.daemon:
+        assistant.check_api_key(interactive=False)
+        try:
+            assistant.serve(args.socket)
+        except DaemonRunning as e:
+            print(f"Output: {str(e)}")
+            return 1
+        return
+    if not args.batch:
+        assistant.start()
+        return
+    assistant.check_api_key(interactive=False)
+    source = sys.stdin if args.batch == "-" else open(args.batch, "r")
+    output = open(args.batch_output, "w") if args.batch_output else sys.stdout
+    try:
+        assistant.run_batch(source, output)
+    finally:
+        if source is not sys.stdin:
+            source.close()
+        if output is not sys.stdout:
+            output.close()
+
 
 if __name__ == "__main__":
-    IshaAssistant()
-```
+    sys.exit(main())